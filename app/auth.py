@@ -1,28 +1,25 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from passlib.context import CryptContext
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
 from jose import jwt, JWTError
 from datetime import datetime, timedelta
+import time
 
 from . import models, schemas
-from .database import SessionLocal
+from .database import AsyncSessionLocal
+from .services import user_cache
+from .services.password_hasher import PasswordHasherBusy, password_hasher, pwd_context
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 
 router = APIRouter()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+# Для маршрутов, доступных и без входа
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
 SECRET_KEY = "your_secret_key"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 def get_password_hash(password):
     return pwd_context.hash(password)
 
@@ -35,43 +32,126 @@ def create_access_token(data: dict):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def decode_access_token(token: str) -> dict:
+    """Разбор JWT с мемоизацией до истечения токена. Бросает JWTError."""
+    payload = user_cache.get_token_payload(token)
+    if payload is None:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        user_cache.remember_token_payload(token, payload)
+    elif payload.get("exp") is not None and payload["exp"] < time.time():
+        raise JWTError("Signature has expired.")
+    return payload
+
+async def load_user(username: str, expires_at=None):
+    """Пользователь из кэша; в БД идём только при промахе."""
+    user = user_cache.get_user(username)
+    if user is not None:
+        return user
+
+    async with AsyncSessionLocal() as db:
+        user = await db.scalar(select(models.User).where(models.User.username == username))
+        if user is not None:
+            # Отвязываем от сессии: объект живёт в кэше дольше запроса
+            db.expunge(user)
+
+    if user is not None:
+        user_cache.remember_user(username, user, expires_at)
+    return user
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_access_token(token)
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
 
-    user = db.query(models.User).filter(models.User.username == username).first()
+    user = await load_user(username, payload.get("exp"))
     if user is None:
         raise credentials_exception
     return user
 
+# --- Работа с БД для регистрации и входа (асинхронные сессии) ---
+async def _username_taken(username: str) -> bool:
+    async with AsyncSessionLocal() as db:
+        return await db.scalar(select(models.User.id).where(models.User.username == username)) is not None
+
+async def _create_user(username: str, hashed_password: str) -> bool:
+    async with AsyncSessionLocal() as db:
+        db.add(models.User(username=username, hashed_password=hashed_password))
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Параллельная регистрация с тем же именем успела раньше
+            await db.rollback()
+            return False
+    return True
+
+async def _get_credentials(username: str):
+    async with AsyncSessionLocal() as db:
+        row = (await db.execute(
+            select(models.User.id, models.User.hashed_password).where(models.User.username == username)
+        )).first()
+    return tuple(row) if row else None
+
+async def _update_password_hash(user_id: int, hashed_password: str):
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(models.User).where(models.User.id == user_id).values(hashed_password=hashed_password))
+        await db.commit()
+
+def _busy_exception():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many authentication requests, try again shortly",
+        headers={"Retry-After": "1"},
+    )
+
+async def get_optional_user(token: str = Depends(optional_oauth2_scheme)):
+    """Пользователь, если передан валидный токен, иначе None (анонимный запрос)."""
+    if not token:
+        return None
+    try:
+        return await get_current_user(token)
+    except HTTPException:
+        return None
+
 @router.post("/register", response_model=schemas.Token)
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    if db.query(models.User).filter_by(username=user.username).first():
+async def register(user: schemas.UserCreate):
+    if await _username_taken(user.username):
         raise HTTPException(status_code=400, detail="Username already taken")
-    hashed_pw = get_password_hash(user.password)
-    new_user = models.User(username=user.username, hashed_password=hashed_pw)
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    token = create_access_token(data={"sub": new_user.username})
+    try:
+        hashed_pw = await password_hasher.hash(user.password)
+    except PasswordHasherBusy:
+        raise _busy_exception()
+    if not await _create_user(user.username, hashed_pw):
+        raise HTTPException(status_code=400, detail="Username already taken")
+    user_cache.invalidate_user(user.username)
+    token = create_access_token(data={"sub": user.username})
     return {"access_token": token, "token_type": "bearer"}
 
 @router.post("/token", response_model=schemas.Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter_by(username=form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+    credentials = await _get_credentials(form_data.username)
+    try:
+        if credentials is None:
+            await password_hasher.dummy_verify()
+            valid, new_hash = False, None
+        else:
+            valid, new_hash = await password_hasher.verify_and_update(form_data.password, credentials[1])
+    except PasswordHasherBusy:
+        raise _busy_exception()
+    if not valid:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
-    token = create_access_token(data={"sub": user.username})
+    if new_hash is not None:
+        # Хэш посчитан со старыми параметрами — сохраняем пересчитанный
+        await _update_password_hash(credentials[0], new_hash)
+    token = create_access_token(data={"sub": form_data.username})
     return {"access_token": token, "token_type": "bearer"}
 
 @router.get("/users/me", response_model=schemas.UserOut)
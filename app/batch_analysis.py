@@ -0,0 +1,114 @@
+"""
+Пакетный анализ лиц по директории с изображениями.
+
+    python -m app.batch_analysis photos/ -o results.jsonl
+    python -m app.batch_analysis photos/ -o results.parquet --format parquet --landmarks
+"""
+import argparse
+import json
+import os
+import sys
+
+from app.face_analysis import analyze_faces
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+
+# Строковые признаки из FaceBatch.result
+FEATURE_COLUMNS = (
+    "skin_tone", "undertone", "eye_distance", "face_shape", "eye_shape",
+    "lip_shape", "brow_shape", "cheek_undertone", "skin_type",
+)
+
+
+def iter_image_paths(directory: str):
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                yield os.path.join(root, name)
+
+
+def iter_batches(paths, batch_size: int):
+    batch = []
+    for path in paths:
+        batch.append(path)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def analyze_directory(directory: str, batch_size: int = 32, include_landmarks: bool = False):
+    """Отдаёт по одной записи на изображение, обрабатывая файлы пачками."""
+    for paths in iter_batches(iter_image_paths(directory), batch_size):
+        images = []
+        for path in paths:
+            with open(path, "rb") as f:
+                images.append(f.read())
+
+        batch = analyze_faces(images)
+        for path, result in zip(paths, batch.results(include_landmarks=include_landmarks)):
+            yield {"path": os.path.relpath(path, directory), **result}
+
+
+def write_jsonl(records, output_path: str) -> int:
+    count = 0
+    with open(output_path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def parquet_schema(pa, include_landmarks: bool):
+    """
+    Явная схема: иначе pyarrow выводит её из первой строки, и в пачке,
+    начинающейся с ошибки, теряются колонки признаков.
+    """
+    fields = [
+        pa.field("path", pa.string()),
+        pa.field("error", pa.string()),
+        pa.field("average_rgb", pa.list_(pa.int32())),
+        *(pa.field(name, pa.string()) for name in FEATURE_COLUMNS),
+    ]
+    if include_landmarks:
+        fields.append(pa.field("landmarks", pa.list_(pa.list_(pa.float32()))))
+    return pa.schema(fields)
+
+
+def write_parquet(records, output_path: str) -> int:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("Parquet output requires pyarrow: pip install pyarrow")
+
+    rows = list(records)
+    schema = parquet_schema(pa, include_landmarks=any("landmarks" in row for row in rows))
+    pq.write_table(pa.Table.from_pylist(rows, schema=schema), output_path)
+    return len(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch face analysis over a directory of images")
+    parser.add_argument("directory")
+    parser.add_argument("-o", "--output", default="face_analysis.jsonl")
+    parser.add_argument("--format", choices=["jsonl", "parquet"], default=None,
+                        help="по умолчанию определяется по расширению выходного файла")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--landmarks", action="store_true", help="сохранять 478 точек для каждого лица")
+    args = parser.parse_args(argv)
+
+    output_format = args.format or ("parquet" if args.output.endswith(".parquet") else "jsonl")
+    records = analyze_directory(args.directory, args.batch_size, args.landmarks)
+
+    if output_format == "parquet":
+        count = write_parquet(records, args.output)
+    else:
+        count = write_jsonl(records, args.output)
+
+    print(f"✅ Analyzed {count} images -> {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
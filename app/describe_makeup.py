@@ -1,30 +1,38 @@
-from openai import OpenAI
 import base64
-import os
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from app.services.executor import run_blocking
+from app.services.llm_gateway import chat_completion
+from app.services.outbound_images import prepare_outbound
 
-def describe_makeup_from_image(image_path: str) -> str:
-    with open(image_path, "rb") as img:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a makeup expert. Describe the makeup style on the photo in detail using natural language so it can be used as a prompt for AI makeup generation."
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64.b64encode(img.read()).decode()}"
-                            }
+async def describe_makeup_from_image(image) -> str:
+    """
+    Принимает байты изображения (bytes или memoryview) или путь к файлу.
+    Перед отправкой изображение уменьшается до полезного для vision-модели размера.
+    """
+    if isinstance(image, str):
+        with open(image, "rb") as img:
+            image = img.read()
+
+    image = await run_blocking("image_prepare", prepare_outbound, image, "openai_vision")
+
+    return await chat_completion(
+        model="gpt-4o",
+        messages=[
+            {
+                "role": "system",
+                "content": "You are a makeup expert. Describe the makeup style on the photo in detail using natural language so it can be used as a prompt for AI makeup generation."
+            },
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:image/jpeg;base64,{base64.b64encode(image).decode()}"
                         }
-                    ]
-                }
-            ],
-            max_tokens=300
-        )
-    return response.choices[0].message.content
+                    }
+                ]
+            }
+        ],
+        max_tokens=300
+    )
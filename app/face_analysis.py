@@ -1,132 +1,306 @@
-import mediapipe as mp
-import cv2
-from PIL import Image
 import numpy as np
-import colorsys
-import io
+
+from app.providers import get_face_mesh_pool
+from app.schemas import FaceProfile
+from app.services import metrics
+from app.services.decoded_image import DecodedImage
+
+# FaceMesh с refine_landmarks=True возвращает 468 точек лица + 10 точек радужек
+NUM_LANDMARKS = 478
+
+# Индексы точек, по которым считаются пропорции лица
+FACE_TOP, CHIN = 10, 152
+LEFT_CHEEK, RIGHT_CHEEK = 234, 454
+LEFT_JAW, RIGHT_JAW = 130, 359
+LEFT_FOREHEAD, RIGHT_FOREHEAD = 127, 356
+LEFT_IRIS, RIGHT_IRIS = 468, 473
+EYE_OUTER, EYE_INNER, EYE_TOP, EYE_BOTTOM = 33, 133, 159, 145
+LIP_LEFT, LIP_RIGHT, LIP_TOP, LIP_BOTTOM = 61, 291, 13, 14
+BROW_INNER, BROW_OUTER = 55, 65
+CHEEK_PATCH_RADIUS = 5
+
+# Участок кожи для оценки тона, в долях ширины/высоты кадра
+SKIN_CROP = (0.45, 0.4, 0.55, 0.5)
+
+
+# ---------------- ВЕКТОРИЗОВАННЫЕ КЛАССИФИКАТОРЫ ---------------- #
+
+def classify_skin_tones(luminance: np.ndarray) -> np.ndarray:
+    luminance = np.asarray(luminance, dtype=np.float64)
+    return np.select(
+        [np.isnan(luminance), luminance < 0.3, luminance < 0.6],
+        ["unknown", "deep", "medium"],
+        default="light",
+    )
+
+def rgb_to_hue_degrees(rgb: np.ndarray) -> np.ndarray:
+    """Оттенок (HLS hue) в целых градусах для массива цветов формы (N, 3), как в colorsys."""
+    rgb = np.asarray(rgb, dtype=np.float64) / 255.0
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    maxc = rgb.max(axis=-1)
+    minc = rgb.min(axis=-1)
+    rangec = maxc - minc
+    safe_range = np.where(rangec == 0, 1.0, rangec)
+    rc = (maxc - r) / safe_range
+    gc = (maxc - g) / safe_range
+    bc = (maxc - b) / safe_range
+    h = np.select([r == maxc, g == maxc], [bc - gc, 2.0 + rc - bc], default=4.0 + gc - rc)
+    h = np.where(rangec == 0, 0.0, (h / 6.0) % 1.0)
+    return np.floor(h * 360)
+
+def classify_undertones(rgb: np.ndarray) -> np.ndarray:
+    rgb = np.asarray(rgb, dtype=np.float64)
+    hue = rgb_to_hue_degrees(np.nan_to_num(rgb))
+    return np.select(
+        [np.isnan(rgb).any(axis=-1), (hue <= 30) | (hue >= 330), (hue >= 180) & (hue <= 300)],
+        ["unknown", "warm", "cool"],
+        default="neutral",
+    )
+
+def classify_eye_distances(landmarks: np.ndarray) -> np.ndarray:
+    eye_distance = np.abs(landmarks[:, LEFT_IRIS, 0] - landmarks[:, RIGHT_IRIS, 0])
+    return np.select(
+        [np.isnan(eye_distance), eye_distance > 0.15, eye_distance < 0.10],
+        ["unknown", "wide", "close"],
+        default="medium",
+    )
+
+def detect_face_shapes(landmarks: np.ndarray, sizes: np.ndarray) -> np.ndarray:
+    """
+    Форма лица для пачки: landmarks формы (N, 478, 3), sizes — (N, 2) ширина и высота в пикселях.
+    """
+    points = landmarks[:, :, :2] * np.asarray(sizes, dtype=np.float32)[:, None, :]
+
+    def distance(i, j):
+        return np.linalg.norm(points[:, i] - points[:, j], axis=-1)
+
+    face_length = distance(FACE_TOP, CHIN)
+    forehead_width = distance(LEFT_FOREHEAD, RIGHT_FOREHEAD)
+    cheekbone_width = distance(LEFT_CHEEK, RIGHT_CHEEK)
+    jaw_width = distance(LEFT_JAW, RIGHT_JAW)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio_length_to_width = face_length / cheekbone_width
+        forehead_to_jaw = forehead_width / jaw_width
+
+    return np.select(
+        [
+            np.isnan(face_length),
+            (ratio_length_to_width >= 1.5) & (np.abs(forehead_to_jaw - 1) < 0.15),
+            (np.abs(cheekbone_width - jaw_width) < 20) & (np.abs(forehead_width - jaw_width) < 20),
+            (forehead_width > jaw_width) & (forehead_to_jaw > 1.2),
+            (cheekbone_width > forehead_width) & (cheekbone_width > jaw_width) & (forehead_to_jaw < 0.9),
+            ratio_length_to_width < 1.1,
+        ],
+        ["unknown", "long", "square", "heart", "diamond", "round"],
+        default="oval",
+    )
+
+def _planar_distance(landmarks: np.ndarray, i: int, j: int) -> np.ndarray:
+    return np.linalg.norm(landmarks[:, i, :2] - landmarks[:, j, :2], axis=-1)
+
+def classify_eye_shapes(landmarks: np.ndarray) -> np.ndarray:
+    eye_ratio = _planar_distance(landmarks, EYE_INNER, EYE_OUTER) / (
+        _planar_distance(landmarks, EYE_TOP, EYE_BOTTOM) + 1e-6
+    )
+    return np.select(
+        [np.isnan(eye_ratio), (eye_ratio > 2.5) & (eye_ratio < 4), eye_ratio <= 2.5],
+        ["unknown", "almond", "round"],
+        default="monolid",
+    )
+
+def classify_lip_shapes(landmarks: np.ndarray) -> np.ndarray:
+    lip_ratio = _planar_distance(landmarks, LIP_RIGHT, LIP_LEFT) / (
+        _planar_distance(landmarks, LIP_TOP, LIP_BOTTOM) + 1e-6
+    )
+    return np.select([np.isnan(lip_ratio), lip_ratio < 2], ["unknown", "heart"], default="full")
+
+def classify_brow_shapes(landmarks: np.ndarray) -> np.ndarray:
+    brow_slope = landmarks[:, BROW_OUTER, 1] - landmarks[:, BROW_INNER, 1]
+    return np.select([np.isnan(brow_slope), brow_slope < -0.02], ["unknown", "arched"], default="straight")
+
+def classify_cheek_undertones(rgb: np.ndarray) -> np.ndarray:
+    """Подтон по доминирующему каналу цвета щеки."""
+    rgb = np.asarray(rgb, dtype=np.float64)
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    return np.select(
+        [np.isnan(rgb).any(axis=-1), (r > g) & (r > b), (b > r) & (b > g)],
+        ["unknown", "warm", "cool"],
+        default="neutral",
+    )
+
+
+# ---------------- СКАЛЯРНЫЕ ОБЁРТКИ ---------------- #
 
 def classify_skin_tone(luminance: float) -> str:
-    if luminance < 0.3:
-        return "deep"
-    elif luminance < 0.6:
-        return "medium"
-    else:
-        return "light"
+    return str(classify_skin_tones(np.array([luminance]))[0])
 
 def classify_undertone(r, g, b) -> str:
-    r_norm, g_norm, b_norm = [x / 255.0 for x in (r, g, b)]
-    h, _, _ = colorsys.rgb_to_hls(r_norm, g_norm, b_norm)
-    hue_degrees = int(h * 360)
-
-    if 0 <= hue_degrees <= 30 or 330 <= hue_degrees <= 360:
-        return "warm"
-    elif 180 <= hue_degrees <= 300:
-        return "cool"
-    else:
-        return "neutral"
+    return str(classify_undertones(np.array([[r, g, b]]))[0])
 
 def euclidean(p1, p2):
     return np.linalg.norm(np.array(p1) - np.array(p2))
 
 def detect_face_shape(landmarks: list, image_width: int, image_height: int) -> str:
-    def px(i):
-        x, y, _ = landmarks[i]
-        return (x * image_width, y * image_height)
-
-    top = px(10)
-    chin = px(152)
-    left_cheek = px(234)
-    right_cheek = px(454)
-    left_jaw = px(130)
-    right_jaw = px(359)
-    left_forehead = px(127)
-    right_forehead = px(356)
-
-    face_length = euclidean(top, chin)
-    forehead_width = euclidean(left_forehead, right_forehead)
-    cheekbone_width = euclidean(left_cheek, right_cheek)
-    jaw_width = euclidean(left_jaw, right_jaw)
-
-    ratio_length_to_width = face_length / cheekbone_width
-    jaw_to_cheek = jaw_width / cheekbone_width
-    forehead_to_jaw = forehead_width / jaw_width
-
-    if ratio_length_to_width >= 1.5 and abs(forehead_to_jaw - 1) < 0.15:
-        return "long"
-    elif abs(cheekbone_width - jaw_width) < 20 and abs(forehead_width - jaw_width) < 20:
-        return "square"
-    elif forehead_width > jaw_width and forehead_to_jaw > 1.2:
-        return "heart"
-    elif cheekbone_width > forehead_width and cheekbone_width > jaw_width and forehead_to_jaw < 0.9:
-        return "diamond"
-    elif ratio_length_to_width < 1.1:
-        return "round"
-    else:
-        return "oval"
-
-def analyze_face(image_bytes: bytes) -> dict:
-    results_data = {}
-    mp_face_mesh = mp.solutions.face_mesh
-
-    file_bytes = np.frombuffer(image_bytes, np.uint8)
-    image = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
-
-    if image is None:
-        return {"error": "Could not load image"}
-
-    with mp_face_mesh.FaceMesh(static_image_mode=True, max_num_faces=1, refine_landmarks=True) as face_mesh:
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        results = face_mesh.process(rgb_image)
-
-        if not results.multi_face_landmarks:
-            return {"error": "No face detected"}
-
-        face_landmarks = results.multi_face_landmarks[0]
-        coords = [(lm.x, lm.y, lm.z) for lm in face_landmarks.landmark]
-        results_data['landmarks'] = coords 
+    landmarks = np.asarray(landmarks, dtype=np.float32)[None]
+    return str(detect_face_shapes(landmarks, np.array([[image_width, image_height]]))[0])
 
-        try:
-            image_pil = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-            width, height = image_pil.size
-            crop_box = (
-                int(width * 0.45),
-                int(height * 0.4),
-                int(width * 0.55),
-                int(height * 0.5)
-            )
-            face_region = image_pil.crop(crop_box)
-            pixels = np.array(face_region).reshape(-1, 3)
-
-            avg_color = pixels.mean(axis=0)
-            r, g, b = avg_color
-            results_data["average_rgb"] = [int(r), int(g), int(b)]
-
-            luminance = (0.299 * r + 0.587 * g + 0.114 * b) / 255
-            results_data["skin_tone"] = classify_skin_tone(luminance)
-            results_data["undertone"] = classify_undertone(r, g, b)
-
-        except Exception as e:
+
+# ---------------- АНАЛИЗ ---------------- #
+
+def decode_image(image) -> DecodedImage:
+    if isinstance(image, DecodedImage):
+        return image
+    return DecodedImage.from_bytes(image)
+
+def detect_landmarks(decoded: DecodedImage):
+    """Прогоняет кадр через FaceMesh и возвращает массив (478, 3) float32 или None."""
+    with get_face_mesh_pool().checkout() as face_mesh:
+        results = face_mesh.process(decoded.rgb)
+
+    if not results.multi_face_landmarks:
+        return None
+
+    return np.array(
+        [(lm.x, lm.y, lm.z) for lm in results.multi_face_landmarks[0].landmark],
+        dtype=np.float32,
+    )
+
+def average_skin_color(decoded: DecodedImage) -> np.ndarray:
+    pixels = decoded.crop_relative(*SKIN_CROP).reshape(-1, 3)
+    if not pixels.size:
+        return np.full(3, np.nan)
+    return pixels.mean(axis=0)
+
+def average_cheek_color(decoded: DecodedImage, landmarks: np.ndarray) -> np.ndarray:
+    h, w, _ = decoded.rgb.shape
+    cx = int(landmarks[LEFT_CHEEK, 0] * w)
+    cy = int(landmarks[LEFT_CHEEK, 1] * h)
+    r = CHEEK_PATCH_RADIUS
+    patch = decoded.rgb[max(0, cy - r):cy + r, max(0, cx - r):cx + r]
+    if not patch.size:
+        return np.full(3, 128.0)
+    return patch.reshape(-1, 3).mean(axis=0)
+
+
+class FaceBatch:
+    """
+    Результат пакетного анализа.
+
+    landmarks — один массив (N, 478, 3) float32 (NaN для изображений без лица),
+    detected — булева маска найденных лиц, остальные поля — массивы длины N.
+    """
+
+    def __init__(self, landmarks, detected, sizes, average_rgb, cheek_rgb, errors):
+        self.landmarks = landmarks
+        self.detected = detected
+        self.sizes = sizes
+        self.average_rgb = average_rgb
+        self.cheek_rgb = cheek_rgb
+        self.errors = errors
+
+        rgb = average_rgb.astype(np.float64)
+        self.luminance = (rgb @ np.array([0.299, 0.587, 0.114])) / 255
+        self.skin_tone = classify_skin_tones(self.luminance)
+        self.undertone = classify_undertones(rgb)
+        self.eye_distance = classify_eye_distances(landmarks)
+        self.face_shape = detect_face_shapes(landmarks, sizes)
+        self.eye_shape = classify_eye_shapes(landmarks)
+        self.lip_shape = classify_lip_shapes(landmarks)
+        self.brow_shape = classify_brow_shapes(landmarks)
+        self.cheek_undertone = classify_cheek_undertones(cheek_rgb)
+
+    def __len__(self):
+        return len(self.detected)
+
+    def result(self, i: int, include_landmarks: bool = True) -> dict:
+        """Результат для одного изображения в формате analyze_face."""
+        if not self.detected[i]:
+            return {"error": self.errors[i]}
+
+        results_data = {}
+        if include_landmarks:
+            results_data["landmarks"] = self.landmarks[i].tolist()
+
+        if np.isnan(self.average_rgb[i]).any():
             results_data["skin_tone"] = "unknown"
             results_data["undertone"] = "unknown"
-            results_data["error"] = f"Color analysis failed: {str(e)}"
+            results_data["error"] = "Color analysis failed: empty skin region"
+        else:
+            results_data["average_rgb"] = [int(c) for c in self.average_rgb[i]]
+            results_data["skin_tone"] = str(self.skin_tone[i])
+            results_data["undertone"] = str(self.undertone[i])
+
+        results_data["eye_distance"] = str(self.eye_distance[i])
+        results_data["face_shape"] = str(self.face_shape[i])
+        results_data["eye_shape"] = str(self.eye_shape[i])
+        results_data["lip_shape"] = str(self.lip_shape[i])
+        results_data["brow_shape"] = str(self.brow_shape[i])
+        results_data["cheek_undertone"] = str(self.cheek_undertone[i])
+        results_data["skin_type"] = "normal"
+        return results_data
+
+    def results(self, include_landmarks: bool = True) -> list:
+        return [self.result(i, include_landmarks) for i in range(len(self))]
 
+    def profile(self, i: int, include_landmarks: bool = True) -> FaceProfile:
+        return FaceProfile(**self.result(i, include_landmarks))
+
+
+def analyze_faces(images) -> FaceBatch:
+    """
+    Пакетный анализ: FaceMesh прогоняется по каждому кадру, а все признаки
+    считаются векторно по всей пачке сразу.
+    """
+    images = list(images)
+    n = len(images)
+    landmarks = np.full((n, NUM_LANDMARKS, 3), np.nan, dtype=np.float32)
+    detected = np.zeros(n, dtype=bool)
+    sizes = np.ones((n, 2), dtype=np.float32)
+    average_rgb = np.full((n, 3), np.nan)
+    cheek_rgb = np.full((n, 3), np.nan)
+    errors = [None] * n
+
+    for i, image in enumerate(images):
         try:
-            left_eye = face_landmarks.landmark[468]
-            right_eye = face_landmarks.landmark[473]
-            eye_distance = abs(left_eye.x - right_eye.x)
+            with metrics.timed(metrics.face_analysis_seconds, step="decode"):
+                decoded = decode_image(image)
+        except Exception:
+            errors[i] = "Could not load image"
+            metrics.face_analysis_images_total.inc(result="decode_error")
+            continue
+
+        with metrics.timed(metrics.face_analysis_seconds, step="face_mesh"):
+            points = detect_landmarks(decoded)
+        if points is None:
+            errors[i] = "No face detected"
+            metrics.face_analysis_images_total.inc(result="no_face")
+            continue
+
+        landmarks[i, :len(points)] = points
+        detected[i] = True
+        metrics.face_analysis_images_total.inc(result="ok")
+        # Пороги формы лица заданы в пикселях оригинала, поэтому масштабируем к нему
+        sizes[i] = (decoded.width, decoded.height)
+        with metrics.timed(metrics.face_analysis_seconds, step="colors"):
+            average_rgb[i] = average_skin_color(decoded)
+            cheek_rgb[i] = average_cheek_color(decoded, points)
+
+    with metrics.timed(metrics.face_analysis_seconds, step="classify"):
+        return FaceBatch(landmarks, detected, sizes, average_rgb, cheek_rgb, errors)
 
-            if eye_distance > 0.15:
-                results_data['eye_distance'] = "wide"
-            elif eye_distance < 0.10:
-                results_data['eye_distance'] = "close"
-            else:
-                results_data['eye_distance'] = "medium"
-        except:
-            results_data['eye_distance'] = "unknown"
 
-        results_data["face_shape"] = detect_face_shape(
-            coords, image_width=image.shape[1], image_height=image.shape[0]
-        )
+def extract_face_profile(image, include_landmarks: bool = True) -> FaceProfile:
+    """
+    Единый извлекатель черт лица: один декод и один прогон FaceMesh дают
+    и тон/подтон кожи, и форму лица, глаз, губ и бровей.
+    """
+    return analyze_faces([image]).profile(0, include_landmarks)
 
-    return results_data
 
+def analyze_face(image) -> dict:
+    """
+    Принимает байты изображения или уже декодированный DecodedImage.
+    Возвращает тот же профиль, что extract_face_profile, в виде словаря.
+    """
+    return analyze_faces([image]).result(0)
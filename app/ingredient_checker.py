@@ -1,46 +1,60 @@
-import os
 import json
-from dotenv import load_dotenv
-from openai import OpenAI
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from app.services.executor import run_blocking
+from app.services.llm_gateway import chat_completion
+from app.services.ingredient_store import CATEGORIES, ingredient_store, tokenize_ingredients
 
+# Модели отправляются только ингредиенты, которых нет в локальном хранилище
 SYSTEM_PROMPT = """
-Ты — эксперт по косметическим ингредиентам. 
-Раздели список ингредиентов на три группы:
-1. Комедогенные
-2. Безопасные
-3. Неизвестные или требующие осторожности
-
-Добавь пояснение к каждому ингредиенту.
-Выводи строго в JSON-формате:
-
-{
-  "comedogenic": [{"name": "название", "note": "пояснение"}],
-  "safe": [{"name": "название", "note": "пояснение"}],
-  "unknown": [{"name": "название", "note": "пояснение"}]
-}
+Ты — эксперт по косметическим ингредиентам.
+Для каждого ингредиента из списка определи группу:
+"comedogenic" — комедогенный,
+"safe" — безопасный,
+"unknown" — неизвестный или требующий осторожности.
+Добавь короткое пояснение (до 12 слов).
+Выводи строго JSON-объект, ключи — названия ровно как в списке:
+
+{"название": {"category": "safe", "note": "пояснение"}}
 """
 
-def check_ingredients(input_text: str):
-    try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            temperature=0.2,
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": f"Вот список ингредиентов:\n{input_text.strip()}"}
-            ]
-        )
-        content = response.choices[0].message.content
-
-        return json.loads(content)
-
-    except Exception as e:
-        print("❌ Ошибка при работе с OpenAI:", e)
-        return {
-            "comedogenic": [],
-            "safe": [],
-            "unknown": [str(e)]
-        }
+async def classify_unknown_ingredients(names: list) -> dict:
+    reply = await chat_completion(
+        model="gpt-3.5-turbo",
+        temperature=0.2,
+        response_format={"type": "json_object"},
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": "\n".join(names)}
+        ]
+    )
+    content = json.loads(reply)
+
+    classified = {}
+    for name in names:
+        entry = content.get(name)
+        if not isinstance(entry, dict) or entry.get("category") not in CATEGORIES:
+            continue
+        classified[name] = {"category": entry["category"], "note": str(entry.get("note", ""))}
+    return classified
+
+async def check_ingredients(input_text: str):
+    tokens = tokenize_ingredients(input_text)
+    # Первое обращение загружает индекс из БД — делаем это вне event loop
+    known, unknown = await run_blocking("db", ingredient_store.lookup, [canonical for _, canonical in tokens])
+
+    if unknown:
+        try:
+            classified = await classify_unknown_ingredients(unknown)
+            await run_blocking("db", ingredient_store.save, classified)
+            known.update(classified)
+        except Exception as e:
+            print("❌ Ошибка при работе с OpenAI:", e)
+
+    result = {category: [] for category in CATEGORIES}
+    for display, canonical in tokens:
+        entry = known.get(canonical)
+        if entry is None:
+            result["unknown"].append({"name": display, "note": "Не удалось проверить ингредиент"})
+        else:
+            result[entry["category"]].append({"name": display, "note": entry["note"]})
+    return result
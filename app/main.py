@@ -1,7 +1,11 @@
-from fastapi import FastAPI, UploadFile, File, Request
+from fastapi import FastAPI, UploadFile, File, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-import shutil
+from typing import Optional
+import asyncio
+import json
+import time
 import uuid
 import os
 from starlette.middleware.sessions import SessionMiddleware
@@ -9,22 +13,37 @@ from starlette.config import Config
 
 from app.makeup_recommender import (
     chat_with_beauty_assistant,
+    stream_beauty_assistant,
     generate_makeup_prompt,
     generate_ai_prompt_with_openai
 )
-from app.face_analysis import analyze_face
-from app.runway_utils import image_to_image as generate_image_from_selfie
-from app.describe_makeup import describe_makeup_from_image
+from app import providers
+from app.services import executor, metrics
+from app.services.analysis_cache import analysis_cache, analyze_face_cached
+from app.services.generation_cache import generation_cache
+from app.services.outbound_images import outbound_stats
+from app.services.user_cache import user_cache_stats
+from app.services.password_hasher import password_hasher
+from app.services.reference_index import describe_reference_cached, reference_index
+from app.services.chat_sessions import chat_sessions, reset_session, resolve_session
+from app.services.llm_gateway import gateway_stats
+from app.services.uploads import UploadSizeLimitMiddleware, persist_upload, read_upload
+from app.runway_utils import image_to_image_async as generate_image_from_selfie, prepare_image_for_runway
+from app.services.pipeline import Pipeline, PipelineError, Stage
+from app.services.runway_poller import runway_poller
 from app import auth, models  # Временно отключаем аутентификацию
+from app.auth import get_optional_user
+from app.database import dispose_engines, engine
+from app.services.cache import sha256_hex
+from app.services.history import load_face_data, record_look
+from app.migrations import migrate
 from app.ingredient_checker import check_ingredients
 from app.routers.generate_make import router as generate_look_router
+from app.routers.jobs import router as jobs_router
+from app.makeup import router as makeup_video_router
 
 # --- Константы и подготовка директорий ---
 UPLOAD_DIR = "uploads"
-TEMP_DIR = "temp"
-SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./sql_app.db")
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-os.makedirs(TEMP_DIR, exist_ok=True)
 
 # --- FastAPI и middleware ---
 app = FastAPI(
@@ -33,6 +52,10 @@ app = FastAPI(
     version="1.0"
 )
 
+# Добавленный позже middleware оборачивает добавленные раньше: лимит загрузки
+# регистрируется до CORS, чтобы ответ 413 тоже получил CORS-заголовки
+app.add_middleware(UploadSizeLimitMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -45,6 +68,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(metrics.MetricsMiddleware)
+
 # --- Session middleware ---
 config = Config(".env")
 app.add_middleware(SessionMiddleware, secret_key=config("SECRET_KEY"))
@@ -85,13 +110,45 @@ class IngredientCheckResponse(BaseModel):
 
 class ChatRequest(BaseModel):
     message: str
+    session_id: Optional[str] = None  # без него сессия берётся из cookie
 
 class ChatResponse(BaseModel):
     reply: str
+    session_id: Optional[str] = None
 
 class TryOnResponse(BaseModel):
     image_url: str
     prompt_used: str
+    timings_ms: Optional[dict] = None
+
+# --- Прогрев моделей ---
+# Прогрев идёт в фоне: лёгкие маршруты отвечают сразу, не дожидаясь загрузки ML-стека
+WARM_UP_ON_STARTUP = os.getenv("WARM_UP_ON_STARTUP", "1") == "1"
+_background_tasks = set()
+
+@app.on_event("startup")
+async def warm_up_face_mesh():
+    if not WARM_UP_ON_STARTUP:
+        return
+    # Загружаем графы FaceMesh заранее, чтобы первый запрос не платил за это
+    task = asyncio.create_task(executor.warm_up())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+# --- Миграции схемы БД ---
+# При нескольких инстансах можно выключить и запускать отдельно: python -m app.migrations
+RUN_MIGRATIONS_ON_STARTUP = os.getenv("RUN_MIGRATIONS_ON_STARTUP", "1") == "1"
+
+@app.on_event("startup")
+async def run_migrations():
+    if RUN_MIGRATIONS_ON_STARTUP:
+        await executor.run_blocking("db", migrate, engine)
+
+@app.on_event("shutdown")
+async def shutdown_executors():
+    executor.shutdown()
+    await providers.aclose()
+    await dispose_engines()
 
 # --- Приветствие ---
 @app.get("/")
@@ -100,23 +157,146 @@ def root():
 
 # --- Chat endpoint ---
 @app.post("/beauty-chat", response_model=ChatResponse)
-async def beauty_chat(request: ChatRequest):
-    reply = chat_with_beauty_assistant(request.message)
-    return ChatResponse(reply=reply)
-
-# --- Makeup Recommendation ---
-@app.post("/makeup-recommendation/")
-async def makeup_recommendation(file: UploadFile = File(...)):
-    filename = f"{uuid.uuid4()}.jpg"
-    file_path = os.path.join(UPLOAD_DIR, filename)
+async def beauty_chat(
+    request: ChatRequest,
+    http_request: Request,
+    user: Optional[models.User] = Depends(get_optional_user)
+):
+    session = resolve_session(http_request, request.session_id, user)
+    reply = await chat_with_beauty_assistant(request.message, session)
+    return ChatResponse(reply=reply, session_id=session.id)
+
+# --- Chat endpoint (стриминг) ---
+# События SSE: token — очередной фрагмент ответа, done — весь ответ и время до первого токена
+@app.post("/beauty-chat/stream")
+async def beauty_chat_stream(
+    request: ChatRequest,
+    http_request: Request,
+    user: Optional[models.User] = Depends(get_optional_user)
+):
+    session = resolve_session(http_request, request.session_id, user)
+
+    async def event_stream():
+        started = time.perf_counter()
+        ttft_ms = None
+        parts = []
+        try:
+            async for delta in stream_beauty_assistant(request.message, session):
+                if ttft_ms is None:
+                    ttft_ms = round((time.perf_counter() - started) * 1000, 1)
+                parts.append(delta)
+                yield f"event: token\ndata: {json.dumps({'delta': delta}, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            print(f"❌ Beauty chat stream failed: {e}")
+            yield f"event: error\ndata: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
+            return
+        reply = "".join(parts).rstrip()
+        yield f"event: done\ndata: {json.dumps({'reply': reply, 'ttft_ms': ttft_ms, 'session_id': session.id}, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+# --- Сброс истории чата ---
+@app.delete("/beauty-chat/session")
+async def reset_beauty_chat(
+    http_request: Request,
+    session_id: Optional[str] = None,
+    user: Optional[models.User] = Depends(get_optional_user)
+):
+    return {"reset": reset_session(http_request, session_id, user)}
+
+# --- Время инициализации компонентов ---
+@app.get("/health/startup")
+def startup_report():
+    return {"components": providers.startup_timings()}
+
+# --- Задержка хэширования паролей ---
+@app.get("/health/password-hashing")
+def password_hashing_report():
+    return password_hasher.stats()
+
+# --- Статистика кэшей ---
+@app.get("/cache/stats")
+def cache_stats():
+    return {
+        "face_analysis": analysis_cache.stats(),
+        "llm": gateway_stats(),
+        "generation": generation_cache.stats(),
+        "try_on_references": reference_index.stats(),
+        "outbound_images": outbound_stats(),
+        "users": user_cache_stats(),
+        "chat_sessions": chat_sessions.stats(),
+    }
 
-    with open(file_path, "rb") as f:
-        image_bytes = f.read()
+# --- Метрики Prometheus ---
+# Счётчики кэшей и очередей уже ведутся в сервисах; здесь они только переводятся в формат Prometheus
+def collect_service_metrics():
+    stats = cache_stats()
+    caches = {
+        "face_analysis": stats["face_analysis"],
+        "llm": stats["llm"]["cache"],
+        "generation": stats["generation"],
+        "try_on_references": stats["try_on_references"],
+        "tokens": {"hits": stats["users"]["token_hits"], "misses": stats["users"]["token_misses"]},
+        "users": {"hits": stats["users"]["user_hits"], "misses": stats["users"]["user_misses"]},
+    }
+    for provider, outbound in stats["outbound_images"].items():
+        caches[f"outbound_{provider}"] = {"hits": outbound["cache_hits"], "misses": outbound["prepared"]}
+
+    llm_models = stats["llm"]["models"]
+    hashing = password_hasher.stats()
+    return [
+        ("cache_hits_total", "counter", "Cache hits",
+         [({"cache": name}, cache["hits"]) for name, cache in caches.items()]),
+        ("cache_misses_total", "counter", "Cache misses",
+         [({"cache": name}, cache["misses"]) for name, cache in caches.items()]),
+        ("llm_coalesced_total", "counter", "LLM calls served by an identical in-flight call",
+         [({"model": model}, model_stats["coalesced"]) for model, model_stats in llm_models.items()]),
+        ("llm_retries_total", "counter", "Retried OpenAI calls",
+         [({"model": model}, model_stats["retries"]) for model, model_stats in llm_models.items()]),
+        ("llm_tokens_total", "counter", "OpenAI tokens used",
+         [({"model": model, "kind": kind}, model_stats[f"{kind}_tokens"])
+          for model, model_stats in llm_models.items() for kind in ("prompt", "completion")]),
+        ("generation_coalesced_total", "counter", "Runway generations served by an identical in-flight one",
+         [({}, stats["generation"]["coalesced"])]),
+        ("password_hash_rejected_total", "counter", "Password hashing requests rejected with a full queue",
+         [({"operation": operation}, hashing[operation]["rejected"]) for operation in ("hash", "verify")]),
+        ("in_flight", "gauge", "Work in progress by component",
+         [({"component": "llm_requests"}, stats["llm"]["in_flight"]),
+          ({"component": "runway_generations"}, stats["generation"]["in_flight"]),
+          ({"component": "runway_polled_tasks"}, runway_poller.pending()),
+          ({"component": "password_hashing"}, hashing["in_flight"])]),
+        ("chat_sessions", "gauge", "Active beauty chat sessions", [({}, stats["chat_sessions"]["sessions"])]),
+    ]
+
+metrics.registry.add_collector(collect_service_metrics)
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
 
-    analysis = analyze_face(image_bytes)
+# --- Makeup Recommendation ---
+@app.post("/makeup-recommendation/")
+async def makeup_recommendation(
+    file: UploadFile = File(...),
+    save: bool = False,
+    user: Optional[models.User] = Depends(get_optional_user)
+):
+    image_bytes = await read_upload(file)
+    image_hash = sha256_hex(image_bytes)
+
+    filename = None
+    if save:
+        filename = f"{uuid.uuid4()}.jpg"
+        await persist_upload(image_bytes, UPLOAD_DIR, filename)
+
+    # Селфи, которое пользователь уже присылал, берём из истории без FaceMesh
+    analysis = await load_face_data(user.id, image_hash) if user is not None else None
+    if analysis is None:
+        analysis = await analyze_face_cached(image_bytes)
 
     if "error" in analysis:
         return {"error": analysis["error"]}
@@ -126,16 +306,23 @@ async def makeup_recommendation(file: UploadFile = File(...)):
         "average_rgb": analysis.get("average_rgb", [0, 0, 0]),
         "face_shape": analysis.get("face_shape", "unknown"),
         "eye_distance": analysis.get("eye_distance", "medium"),
+        "undertone": analysis.get("undertone", "neutral"),
+        "eye_shape": analysis.get("eye_shape", "almond"),
+        "lip_shape": analysis.get("lip_shape", "heart"),
+        "brow_shape": analysis.get("brow_shape", "arched"),
+        "skin_type": analysis.get("skin_type", "normal"),
     }
 
     main_prompt = generate_makeup_prompt(face_data)
     steps = [] 
 
-    image_url = generate_image_from_selfie(image_bytes, prompt_text=main_prompt)
+    image_url = await generate_image_from_selfie(image_bytes, prompt_text=main_prompt)
 
     if not image_url:
         return {"error": "Failed to generate image from Runway"}
 
+    await record_look(user, "makeup_recommendation", image_hash, image_url, prompt=main_prompt, face_data=analysis)
+
     return {
         "filename": file.filename,
         "saved_as": filename,
@@ -146,37 +333,58 @@ async def makeup_recommendation(file: UploadFile = File(...)):
     }
 
 # --- Try On ---
-@app.post("/try-on", response_model=TryOnResponse)
-async def try_on(user_photo: UploadFile = File(...), makeup_reference: UploadFile = File(...)):
-    user_path = os.path.join(TEMP_DIR, f"{uuid.uuid4()}_{user_photo.filename}")
-    ref_path = os.path.join(TEMP_DIR, f"{uuid.uuid4()}_{makeup_reference.filename}")
-
-    with open(user_path, "wb") as f:
-        shutil.copyfileobj(user_photo.file, f)
-    with open(ref_path, "wb") as f:
-        shutil.copyfileobj(makeup_reference.file, f)
+# Описание референса (vision-модель) и подготовка селфи для Runway независимы и идут параллельно
+async def _prepare_selfie(image_bytes) -> bytes:
+    return await executor.run_blocking("runway_prepare", prepare_image_for_runway, image_bytes)
+
+async def _generate_try_on(image_bytes, prompt: str, selfie_prepared: bytes) -> str:
+    if not prompt:
+        # Пустое описание референса в Runway не отправляем
+        raise ValueError("Could not describe the makeup reference")
+    return await generate_image_from_selfie(image_bytes, prompt_text=prompt, prepared=selfie_prepared)
+
+TRY_ON_PIPELINE = Pipeline("try_on", [
+    Stage("prompt", describe_reference_cached, deps=("reference_bytes",)),
+    Stage("selfie_prepared", _prepare_selfie, deps=("image_bytes",)),
+    Stage("image_url", _generate_try_on, deps=("image_bytes", "prompt", "selfie_prepared")),
+])
 
-    with open(user_path, "rb") as f:
-        image_bytes = f.read()
-
-    generated_prompt = describe_makeup_from_image(ref_path)
-    image_url = generate_image_from_selfie(image_bytes, prompt_text=generated_prompt)
+@app.post("/try-on", response_model=TryOnResponse)
+async def try_on(
+    user_photo: UploadFile = File(...),
+    makeup_reference: UploadFile = File(...),
+    user: Optional[models.User] = Depends(get_optional_user)
+):
+    image_bytes = await read_upload(user_photo)
+    reference_bytes = await read_upload(makeup_reference)
+
+    try:
+        run = await TRY_ON_PIPELINE.run({"image_bytes": image_bytes, "reference_bytes": reference_bytes})
+    except PipelineError as e:
+        return JSONResponse(status_code=502, content={"error": str(e.error)})
+    generated_prompt = run.results["prompt"]
+    image_url = run.results["image_url"]
+
+    if image_url:
+        await record_look(user, "try_on", sha256_hex(image_bytes), image_url, prompt=generated_prompt)
 
     if not image_url:
         return {
             "image_url": "https://runway.fake.image/failed.jpg",
-            "prompt_used": generated_prompt
+            "prompt_used": generated_prompt,
+            "timings_ms": run.timings_ms()
         }
 
     return {
         "image_url": image_url,
-        "prompt_used": generated_prompt
+        "prompt_used": generated_prompt,
+        "timings_ms": run.timings_ms()
     }
 
 # --- Ingredient Checker ---
 @app.post("/check-ingredients", response_model=IngredientCheckResponse)
 async def check_ingredients_endpoint(request: IngredientCheckRequest):
-    result = check_ingredients(request.input_text)
+    result = await check_ingredients(request.input_text)
     return IngredientCheckResponse(
         comedogenic=[IngredientNote(**item) for item in result.get("comedogenic", [])],
         safe=[IngredientNote(**item) for item in result.get("safe", [])],
@@ -184,6 +392,8 @@ async def check_ingredients_endpoint(request: IngredientCheckRequest):
     )
 
 app.include_router(generate_look_router)
+app.include_router(jobs_router)
+app.include_router(makeup_video_router)
 
 # Временно отключаем аутентификацию для быстрого запуска
 from app.auth import router as auth_router
@@ -192,7 +402,6 @@ app.include_router(auth_router)
 from app.routers.user_profile import router as user_router
 app.include_router(user_router)
 
-from app.database import engine
-from app import models
+from app.routers.history import router as history_router
+app.include_router(history_router)
 
-models.Base.metadata.create_all(bind=engine)
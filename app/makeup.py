@@ -1,24 +1,108 @@
-from fastapi import APIRouter, UploadFile, File, Depends
-from .face_analysis import analyze_face
-from .makeup_recommender import generate_makeup_prompt
+import asyncio
+import json
+import os
+
+from fastapi import APIRouter, UploadFile, File
+from fastapi.responses import StreamingResponse
+
+from .makeup_recommender import generate_makeup_prompt, generate_makeup_steps
 from .runway_utils import generate_video_from_image
+from .services.analysis_cache import analyze_face_cached
+from .services.uploads import read_upload
+
+# Сколько роликов одного запроса генерируется в Runway одновременно
+VIDEO_CONCURRENCY = int(os.getenv("VIDEO_CONCURRENCY", "3"))
 
 router = APIRouter()
 
+
+async def _prepare(file: UploadFile):
+    image_bytes = await read_upload(file)
+    face_data = await analyze_face_cached(image_bytes)
+    face_data.pop("landmarks", None)
+    return image_bytes, face_data
+
+
+async def generate_videos(image_bytes, main_prompt: str, step_prompts: list, concurrency: int = VIDEO_CONCURRENCY):
+    """
+    Запускает генерацию основного ролика и всех шагов параллельно (не более concurrency
+    одновременно) и отдаёт результаты по мере готовности: ("main", url) или (step, url).
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def generate(key, prompt):
+        async with semaphore:
+            try:
+                return key, await generate_video_from_image(image_bytes, prompt)
+            except Exception as e:
+                print(f"❌ Video generation failed for {key}: {e}")
+                return key, None
+
+    tasks = [asyncio.create_task(generate("main", main_prompt))]
+    tasks += [asyncio.create_task(generate(step["step"], step["description"])) for step in step_prompts]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        # Клиент отключился от стрима — ещё не начатые ролики не запускаем
+        # (уже начатые доезжают в кэше генераций)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
 @router.post("/generate-makeup")
 async def generate_makeup(file: UploadFile = File(...)):
-    face_data = await analyze_face(file)
-    main_prompt, step_prompts = generate_makeup_prompt(face_data)
+    image_bytes, face_data = await _prepare(file)
+    if "error" in face_data:
+        return {"error": face_data["error"]}
+
+    main_prompt = generate_makeup_prompt(face_data)
+    step_prompts = generate_makeup_steps(face_data)
+
+    main_video_url = None
+    video_urls = {}
+    async for key, url in generate_videos(image_bytes, main_prompt, step_prompts):
+        if key == "main":
+            main_video_url = url
+        else:
+            video_urls[key] = url
+
+    steps = [{**step, "video_url": video_urls.get(step["step"])} for step in step_prompts]
+    return {
+        "main_video": main_video_url,
+        "steps": steps,
+        "face_info": face_data
+    }
+
+
+@router.post("/generate-makeup/stream")
+async def generate_makeup_stream(file: UploadFile = File(...)):
+    """То же, что /generate-makeup, но каждый ролик отправляется SSE-событием, как только готов."""
+    image_bytes, face_data = await _prepare(file)
+
+    async def event_stream():
+        if "error" in face_data:
+            yield f"event: error\ndata: {json.dumps({'error': face_data['error']})}\n\n"
+            return
+
+        main_prompt = generate_makeup_prompt(face_data)
+        step_prompts = generate_makeup_steps(face_data)
+        steps_by_number = {step["step"]: step for step in step_prompts}
+
+        yield f"event: plan\ndata: {json.dumps({'face_info': face_data, 'steps': step_prompts}, ensure_ascii=False)}\n\n"
 
-    main_video_url = await generate_video_from_image(prompt=main_prompt)
+        async for key, url in generate_videos(image_bytes, main_prompt, step_prompts):
+            if key == "main":
+                payload = {"main_video": url}
+            else:
+                payload = {**steps_by_number[key], "video_url": url}
+            yield f"event: video\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
 
-    steps = []
-    for step in step_prompts:
-        video_url = await generate_video_from_image(prompt=step["description"])
-        steps.append({**step, "video_url": video_url})
+        yield "event: done\ndata: {}\n\n"
 
-        return {
-            "main_video": main_video_url,
-            "steps": steps,
-            "face_info": face_data
-        }
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,22 +1,10 @@
-from openai import OpenAI
-import os
-from dotenv import load_dotenv
-import os
-import cv2
-import io
-import numpy as np
-from dotenv import load_dotenv
-from openai import OpenAI
-import mediapipe as mp
+from app.services.llm_gateway import chat_completion, stream_chat_completion
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-def generate_ai_prompt_with_openai(user_prompt: str) -> str:
+async def generate_ai_prompt_with_openai(user_prompt: str) -> str:
     """
     Обращается к GPT-4, чтобы сгенерировать продвинутый текст промпта по описанию макияжа.
     """
-    response = client.chat.completions.create(
+    return await chat_completion(
         model="gpt-4",
         messages=[
             {"role": "system", "content": "You are a professional makeup artist telling an AI video model create makeup looks with details."},
@@ -25,79 +13,15 @@ def generate_ai_prompt_with_openai(user_prompt: str) -> str:
         temperature=0.8,
     )
 
-    return response.choices[0].message.content
-
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-mp_face_mesh = mp.solutions.face_mesh
-
 # ---------------- FACE ANALYSIS ---------------- #
 
-def analyze_face(image_bytes: bytes) -> dict:
+def analyze_face(image) -> dict:
     """
-    Анализирует лицо по изображению и извлекает черты: форма глаз, губ, бровей, подтон.
+    Черты лица (форма глаз, губ, бровей, подтон) считает единый
+    извлекатель в app.face_analysis за один прогон FaceMesh.
     """
-    file_bytes = np.frombuffer(image_bytes, dtype=np.uint8)
-    image = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
-
-    if image is None:
-        return {}
-
-    with mp_face_mesh.FaceMesh(static_image_mode=True) as face_mesh:
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        results = face_mesh.process(rgb_image)
-
-        if not results.multi_face_landmarks:
-            return {}
-
-        landmarks = results.multi_face_landmarks[0].landmark
-        h, w, _ = image.shape
-
-        # Eye shape
-        eye_ratio = np.linalg.norm([
-            (landmarks[133].x - landmarks[33].x),
-            (landmarks[133].y - landmarks[33].y)
-        ]) / (np.linalg.norm([
-            (landmarks[159].y - landmarks[145].y),
-            (landmarks[159].x - landmarks[145].x)
-        ]) + 1e-6)
-
-        eye_shape = "almond" if 2.5 < eye_ratio < 4 else ("round" if eye_ratio <= 2.5 else "monolid")
-
-        # Undertone (по цвету щеки)
-        cx = int(landmarks[234].x * w)
-        cy = int(landmarks[234].y * h)
-        cheek_area = image[max(0, cy - 5):cy + 5, max(0, cx - 5):cx + 5]
-        avg_color = np.mean(cheek_area, axis=(0, 1)) if cheek_area.size else [128, 128, 128]
-        b, g, r = avg_color
-        if r > g and r > b:
-            undertone = "warm"
-        elif b > r and b > g:
-            undertone = "cool"
-        else:
-            undertone = "neutral"
-
-        # Lip shape
-        lip_width = np.linalg.norm([
-            landmarks[291].x - landmarks[61].x,
-            landmarks[291].y - landmarks[61].y
-        ])
-        lip_height = np.linalg.norm([
-            landmarks[13].y - landmarks[14].y,
-            landmarks[13].x - landmarks[14].x
-        ])
-        lip_shape = "heart" if lip_width / (lip_height + 1e-6) < 2 else "full"
-
-        # Brow shape
-        brow_slope = landmarks[65].y - landmarks[55].y
-        brow_shape = "arched" if brow_slope < -0.02 else "straight"
-
-        return {
-            "eye_shape": eye_shape,
-            "skin_type": "normal",  
-            "undertone": undertone,
-            "lip_shape": lip_shape,
-            "brow_shape": brow_shape
-        }
+    from app.face_analysis import analyze_face as unified_analyze_face
+    return unified_analyze_face(image)
 
 # ---------------- PROMPT GENERATION ---------------- #
 
@@ -123,19 +47,126 @@ def generate_makeup_prompt(face_data: dict) -> str:
         "Background must be neutral, lighting should be soft and even, and the full face must be centered in the frame."
     )
 
+def generate_makeup_steps(face_data: dict) -> list:
+    """
+    Разбивает образ из generate_makeup_prompt на последовательные шаги — по ролику на каждый.
+    """
+    undertone = face_data.get("undertone", "neutral")
+    eye_shape = face_data.get("eye_shape", "almond")
+    lip_shape = face_data.get("lip_shape", "heart")
+    brow_shape = face_data.get("brow_shape", "arched")
+    face_shape = face_data.get("face_shape", "oval")
+
+    base = (
+        "Same woman, same pose, neutral background, soft even lighting, full face centered in the frame. "
+        "Show the makeup being applied step by step. "
+    )
+
+    return [
+        {
+            "step": 1,
+            "title": "Foundation",
+            "description": base + (
+                f"Apply a radiant medium-coverage foundation matching her {undertone} undertone, "
+                "blending it evenly over the whole face."
+            ),
+        },
+        {
+            "step": 2,
+            "title": "Contour and blush",
+            "description": base + (
+                f"Add subtle creamy contour that flatters a {face_shape} face shape, then soft peach blush on the cheeks "
+                "and golden highlighter on the high points of the face."
+            ),
+        },
+        {
+            "step": 3,
+            "title": "Eyes",
+            "description": base + (
+                f"On {eye_shape}-shaped eyes, blend warm brown eyeshadow in the crease and shimmery champagne on the lids, "
+                "add precise black eyeliner with a small wing and lengthening mascara."
+            ),
+        },
+        {
+            "step": 4,
+            "title": "Brows",
+            "description": base + (
+                f"Shape {brow_shape} eyebrows with a light brown pencil following the natural arch."
+            ),
+        },
+        {
+            "step": 5,
+            "title": "Lips",
+            "description": base + (
+                f"Apply a matte rose-pink lipstick with a satin finish to {lip_shape} lips."
+            ),
+        },
+    ]
+
 BEAUTY_CHAT_SYSTEM_PROMPT = """
 Ты — профессиональный визажист и консультант по уходу за кожей. Отвечай понятно, дружелюбно и по существу. 
 Можешь давать советы по макияжу, выбору оттенков, типу кожи, базовому уходу и подбору продуктов. 
 Не давай медицинских рекомендаций и не советуй препараты.
 """
 
-def chat_with_beauty_assistant(message: str) -> str:
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": BEAUTY_CHAT_SYSTEM_PROMPT},
-            {"role": "user", "content": message}
-        ],
-        temperature=0.7
-    )
-    return response.choices[0].message.content.strip()
+def _beauty_chat_messages(message: str, session=None) -> list:
+    if session is not None:
+        return session.build_messages(BEAUTY_CHAT_SYSTEM_PROMPT, message)
+    return [
+        {"role": "system", "content": BEAUTY_CHAT_SYSTEM_PROMPT},
+        {"role": "user", "content": message}
+    ]
+
+async def chat_with_beauty_assistant(message: str, session=None) -> str:
+    """
+    session (ChatSession) — серверная история диалога; без неё запрос без контекста.
+    """
+    if session is None:
+        reply = await chat_completion(
+            model="gpt-4",
+            messages=_beauty_chat_messages(message),
+            temperature=0.7
+        )
+        return reply.strip()
+
+    async with session.lock:
+        reply = await chat_completion(
+            model="gpt-4",
+            messages=_beauty_chat_messages(message, session),
+            temperature=0.7
+        )
+        reply = reply.strip()
+        session.append(message, reply)
+    session.schedule_compaction()
+    return reply
+
+async def stream_beauty_assistant(message: str, session=None):
+    """
+    То же, что chat_with_beauty_assistant, но отдаёт ответ по фрагментам по мере генерации.
+    В историю сессии попадает только полностью полученный ответ.
+    """
+    if session is not None:
+        await session.lock.acquire()
+    try:
+        leading = True
+        parts = []
+        async for delta in stream_chat_completion(
+            model="gpt-4",
+            messages=_beauty_chat_messages(message, session),
+            temperature=0.7
+        ):
+            # Как и strip() в обычном ответе, убираем пробелы в начале
+            if leading:
+                delta = delta.lstrip()
+                if not delta:
+                    continue
+                leading = False
+            parts.append(delta)
+            yield delta
+        if session is not None:
+            session.append(message, "".join(parts).rstrip())
+    finally:
+        if session is not None:
+            session.lock.release()
+    if session is not None:
+        session.schedule_compaction()
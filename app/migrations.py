@@ -0,0 +1,196 @@
+"""
+Версионированные миграции схемы БД.
+
+Каждая миграция — функция над соединением с номером версии; применённые
+версии записываются в таблицу schema_migrations. Определения таблиц в
+миграциях заморожены (не берутся из app.models), чтобы старая миграция
+не менялась вместе с моделями. Базовые таблицы создаются с checkfirst:
+база, созданная раньше через create_all, принимается как есть.
+
+    python -m app.migrations            # применить недостающие
+    python -m app.migrations --status   # показать текущую версию
+"""
+import argparse
+import time
+
+from sqlalchemy import (
+    JSON,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    MetaData,
+    String,
+    Table,
+    Text,
+    func,
+    insert,
+    select,
+    text,
+)
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, server_default=func.now()),
+)
+
+
+def _create_tables(conn, *tables):
+    for table in tables:
+        table.create(conn, checkfirst=True)
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+def _0001_users(conn):
+    metadata = MetaData()
+    users = Table(
+        "users",
+        metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("username", String, unique=True, index=True),
+        Column("email", String, nullable=True, index=True),
+        Column("hashed_password", String),
+        Column("google_id", String, unique=True, nullable=True),
+    )
+    _create_tables(conn, users)
+
+
+def _0002_ingredients(conn):
+    metadata = MetaData()
+    ingredients = Table(
+        "ingredients",
+        metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("name", String, unique=True, index=True, nullable=False),
+        Column("category", String, nullable=False),
+        Column("note", String, nullable=False, default=""),
+        Column("source", String, nullable=False, default="llm"),
+    )
+    _create_tables(conn, ingredients)
+
+
+def _0003_makeup_references(conn):
+    metadata = MetaData()
+    makeup_references = Table(
+        "makeup_references",
+        metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("phash", String(16), index=True, nullable=False),
+        Column("dhash", String(16), nullable=False),
+        Column("description", Text, nullable=False),
+        Column("created_at", DateTime, server_default=func.now()),
+    )
+    _create_tables(conn, makeup_references)
+
+
+def _0004_face_profiles_and_looks(conn):
+    metadata = MetaData()
+    # Ссылки на users нужны только для внешних ключей
+    Table("users", metadata, Column("id", Integer, primary_key=True))
+    face_profiles = Table(
+        "face_profiles",
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        Column("image_hash", String(64), nullable=False, index=True),
+        Column("features", JSON, nullable=False),
+        Column("landmarks", LargeBinary, nullable=True),
+        Column("created_at", DateTime, nullable=False),
+        Index("ix_face_profiles_user_created", "user_id", "created_at"),
+    )
+    looks = Table(
+        "looks",
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        Column("face_profile_id", Integer, ForeignKey("face_profiles.id", ondelete="SET NULL"), nullable=True),
+        Column("image_hash", String(64), nullable=False, index=True),
+        Column("kind", String, nullable=False),
+        Column("spec", JSON, nullable=True),
+        Column("prompt", Text, nullable=True),
+        Column("image_url", Text, nullable=True),
+        Column("created_at", DateTime, nullable=False),
+        Index("ix_looks_user_created", "user_id", "created_at"),
+    )
+    _create_tables(conn, face_profiles, looks)
+
+
+MIGRATIONS = [
+    (1, "users", _0001_users),
+    (2, "ingredients", _0002_ingredients),
+    (3, "makeup_references", _0003_makeup_references),
+    (4, "face_profiles_and_looks", _0004_face_profiles_and_looks),
+]
+
+
+def current_version(conn) -> int:
+    return conn.execute(select(func.coalesce(func.max(schema_migrations.c.version), 0))).scalar()
+
+
+def _lock(conn):
+    # Несколько воркеров могут стартовать одновременно, поэтому блокировка берётся
+    # до проверки версии: в PostgreSQL — advisory-лок на транзакцию, в SQLite —
+    # BEGIN IMMEDIATE (pysqlite сам открывает транзакцию только перед DML, а DDL
+    # и чтение версии шли бы без блокировки)
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(4242001)"))
+    elif conn.dialect.name == "sqlite":
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def _applied(engine, version: int) -> bool:
+    with engine.connect() as conn:
+        return current_version(conn) >= version
+
+
+def migrate(engine) -> int:
+    """Применяет недостающие миграции, каждую в своей транзакции. Возвращает версию схемы."""
+    for version, name, upgrade in MIGRATIONS:
+        started = time.perf_counter()
+        try:
+            with engine.begin() as conn:
+                _lock(conn)
+                schema_migrations.create(conn, checkfirst=True)
+                if current_version(conn) >= version:
+                    continue
+                upgrade(conn)
+                conn.execute(insert(schema_migrations).values(version=version, name=name))
+        except (IntegrityError, OperationalError):
+            # Ту же миграцию параллельно применил другой воркер (например, блокировка
+            # не дождалась его за busy_timeout) — иначе это настоящая ошибка
+            if _applied(engine, version):
+                continue
+            raise
+        print(f"🗄️ Migration {version:04d}_{name} applied in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    with engine.connect() as conn:
+        return current_version(conn)
+
+
+def main(argv=None):
+    from app.database import engine
+
+    parser = argparse.ArgumentParser(description="Миграции схемы БД")
+    parser.add_argument("--status", action="store_true", help="Показать версию схемы без изменений")
+    args = parser.parse_args(argv)
+
+    if args.status:
+        schema_migrations.create(engine, checkfirst=True)
+        with engine.connect() as conn:
+            version = current_version(conn)
+        print(f"Schema version {version}, latest {MIGRATIONS[-1][0]}")
+        return
+
+    version = migrate(engine)
+    print(f"✅ Schema at version {version}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String
+from datetime import datetime
+
+from sqlalchemy import JSON, Column, DateTime, ForeignKey, Index, Integer, LargeBinary, String, Text, func
 from .database import Base
 
 class User(Base):
@@ -10,3 +12,58 @@ class User(Base):
     hashed_password = Column(String)
 
     google_id = Column(String, unique=True, nullable=True)
+
+
+class Ingredient(Base):
+    __tablename__ = "ingredients"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # Каноническое INCI-название в нижнем регистре, по нему идёт поиск
+    name = Column(String, unique=True, index=True, nullable=False)
+    category = Column(String, nullable=False)  # comedogenic / safe / unknown
+    note = Column(String, nullable=False, default="")
+    source = Column(String, nullable=False, default="llm")
+
+
+class MakeupReference(Base):
+    __tablename__ = "makeup_references"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # 64-битные перцептивные хэши в hex (16 символов)
+    phash = Column(String(16), index=True, nullable=False)
+    dhash = Column(String(16), nullable=False)
+    description = Column(Text, nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+
+
+class FaceProfileRecord(Base):
+    """Сохранённый результат анализа лица пользователя."""
+    __tablename__ = "face_profiles"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    # sha256 исходного изображения
+    image_hash = Column(String(64), nullable=False, index=True)
+    features = Column(JSON, nullable=False)
+    # Точки FaceMesh (N, 3) float32 подряд — ~5.7 КБ вместо ~30 КБ JSON
+    landmarks = Column(LargeBinary, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (Index("ix_face_profiles_user_created", "user_id", "created_at"),)
+
+
+class LookRecord(Base):
+    """Сгенерированный образ: спецификация, промпт и ссылка на результат."""
+    __tablename__ = "looks"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    face_profile_id = Column(Integer, ForeignKey("face_profiles.id", ondelete="SET NULL"), nullable=True)
+    image_hash = Column(String(64), nullable=False, index=True)
+    kind = Column(String, nullable=False)  # generate_look / makeup_recommendation / try_on
+    spec = Column(JSON, nullable=True)
+    prompt = Column(Text, nullable=True)
+    image_url = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (Index("ix_looks_user_created", "user_id", "created_at"),)
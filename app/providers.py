@@ -0,0 +1,151 @@
+"""
+Реестр тяжёлых зависимостей (клиенты OpenAI и Runway, пул FaceMesh).
+
+Всё создаётся лениво при первом обращении и переиспользуется всеми модулями,
+поэтому импорт app.main не тянет mediapipe, runwayml и openai, а лёгкие
+маршруты (/, /token, /users/me) готовы сразу после старта.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Пул соединений к OpenAI общий для всего процесса
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "64"))
+OPENAI_HTTP2 = os.getenv("OPENAI_HTTP2", "1") == "1"
+
+_factories = {}
+_instances = {}
+_startup_timings = {}
+_lock = threading.RLock()
+
+
+def register(name: str):
+    def decorator(factory):
+        _factories[name] = factory
+        return factory
+    return decorator
+
+
+@contextmanager
+def record_startup(name: str):
+    """Замеряет время инициализации компонента и сохраняет его в отчёт."""
+    started = time.perf_counter()
+    yield
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+    _startup_timings[name] = elapsed_ms
+    print(f"⏱️ {name} ready in {elapsed_ms} ms")
+
+
+def get(name: str):
+    instance = _instances.get(name)
+    if instance is not None:
+        return instance
+
+    with _lock:
+        instance = _instances.get(name)
+        if instance is None:
+            with record_startup(name):
+                instance = _factories[name]()
+            _instances[name] = instance
+    return instance
+
+
+def is_loaded(name: str) -> bool:
+    return name in _instances
+
+
+async def aclose():
+    """Закрывает созданные клиенты (пулы соединений) при остановке приложения."""
+    for name in list(_instances):
+        instance = _instances.pop(name)
+        close = getattr(instance, "aclose", None) or getattr(instance, "close", None)
+        if close is None:
+            continue
+        try:
+            result = close()
+            if hasattr(result, "__await__"):
+                await result
+        except Exception as e:
+            print(f"⚠️ Failed to close {name}: {e}")
+
+
+def startup_timings() -> dict:
+    return dict(_startup_timings)
+
+
+def merge_startup_timings(timings: dict, prefix: str):
+    """Добавляет в отчёт замеры из дочерних процессов (берётся худший)."""
+    for name, elapsed_ms in timings.items():
+        key = f"{prefix}.{name}"
+        _startup_timings[key] = max(elapsed_ms, _startup_timings.get(key, 0))
+
+
+@register("openai")
+def _create_openai_client():
+    import httpx
+    from openai import AsyncOpenAI
+
+    http2 = OPENAI_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            print("⚠️ h2 is not installed, OpenAI client falls back to HTTP/1.1")
+            http2 = False
+
+    http_client = httpx.AsyncClient(
+        http2=http2,
+        timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=10.0),
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_CONNECTIONS,
+            keepalive_expiry=60,
+        ),
+    )
+    # Повторы делает шлюз (с джиттером и общим дедлайном), поэтому в SDK они выключены
+    return AsyncOpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        http_client=http_client,
+        max_retries=0,
+        timeout=OPENAI_TIMEOUT,
+    )
+
+
+@register("runway")
+def _create_runway_client():
+    from runwayml import RunwayML
+    return RunwayML(api_key=os.getenv("RUNWAYML_API_SECRET"))
+
+
+@register("face_mesh_pool")
+def _create_face_mesh_pool():
+    from app.services.face_mesh_pool import FaceMeshPool
+    return FaceMeshPool()
+
+
+@register("runway_async")
+def _create_async_runway_client():
+    from runwayml import AsyncRunwayML
+    return AsyncRunwayML(api_key=os.getenv("RUNWAYML_API_SECRET"))
+
+
+def get_openai_client():
+    return get("openai")
+
+
+def get_runway_client():
+    return get("runway")
+
+
+def get_async_runway_client():
+    return get("runway_async")
+
+
+def get_face_mesh_pool():
+    return get("face_mesh_pool")
@@ -0,0 +1,76 @@
+"""
+Офлайн-обновление таблицы MakeupSpec из LLM.
+
+    python -m app.refresh_makeup_specs
+    python -m app.refresh_makeup_specs -o app/data/makeup_specs.json --concurrency 4
+
+Для каждого из 162 сочетаний признаков запрашивает спецификацию у gpt-4;
+сочетания, для которых запрос не удался или ответ не прошёл валидацию,
+остаются на правилах.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+from app.services.makeup_spec_ai import generate_makeup_spec
+from app.services.makeup_spec_table import (
+    MAKEUP_SPEC_TABLE_PATH,
+    all_feature_combinations,
+    build_rule_table,
+    spec_key,
+)
+
+
+async def refresh_table(concurrency: int = 4) -> tuple:
+    table = build_rule_table()
+    semaphore = asyncio.Semaphore(concurrency)
+    failed = []
+
+    async def refresh_one(features):
+        skin_tone, undertone, face_shape, eye_distance = features
+        key = spec_key(features)
+        try:
+            async with semaphore:
+                spec = await generate_makeup_spec({
+                    "skin_tone": skin_tone,
+                    "undertone": undertone,
+                    "face_shape": face_shape,
+                    "eye_distance": eye_distance,
+                })
+        except Exception as e:
+            # Вызов не удался и после повторов — сочетание остаётся на правилах, остальные продолжаются
+            spec = {"error": str(e)}
+        if "error" in spec:
+            failed.append(key)
+        else:
+            table[key] = spec
+
+    await asyncio.gather(*(refresh_one(features) for features in all_feature_combinations()))
+    return table, failed
+
+
+def write_table(table: dict, output_path: str):
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(table, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, output_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Обновление таблицы MakeupSpec из LLM")
+    parser.add_argument("-o", "--output", default=MAKEUP_SPEC_TABLE_PATH, help="Путь к JSON-таблице")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    table, failed = asyncio.run(refresh_table(args.concurrency))
+    write_table(table, args.output)
+    print(f"✅ {len(table) - len(failed)} specs refreshed from LLM, {len(failed)} kept from rules → {args.output}")
+    for key in failed:
+        print(f"   ⚠️ {key}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
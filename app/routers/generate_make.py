@@ -1,35 +1,137 @@
-from fastapi import APIRouter, UploadFile, File, Form
-from fastapi.responses import JSONResponse
+import json
+
+from fastapi import APIRouter, Depends, UploadFile, File, Form
+from fastapi.responses import JSONResponse, StreamingResponse
 from typing import Optional
+from app import models
+from app.auth import get_optional_user
 from app.schemas import MakeupSpec
 
-from app.face_analysis import analyze_face
-from app.services.makeup_spec_ai import generate_makeup_spec
+from app.services.makeup_spec_table import SPEC_MODES, get_makeup_spec
 from app.services.prompt_builder import build_prompt_from_spec
-from app.runway_utils import image_to_image
+from app.runway_utils import image_to_image_async, prepare_image_for_runway
+from app.services.analysis_cache import analyze_face_cached
+from app.services.cache import sha256_hex
+from app.services.executor import run_blocking
+from app.services.history import load_face_data, record_look
+from app.services.pipeline import Pipeline, PipelineRun, Stage
+from app.services.uploads import read_upload
 
 router = APIRouter()
 
+
+async def _face_data(image_bytes, image_hash: str, user) -> dict:
+    # Вошедший пользователь с уже проанализированным селфи обходится без FaceMesh
+    if user is not None:
+        stored = await load_face_data(user.id, image_hash)
+        if stored is not None:
+            return stored
+    return await analyze_face_cached(image_bytes)
+
+
+async def _prepare_selfie(image_bytes) -> bytes:
+    # Селфи готовится для Runway параллельно с анализом лица
+    return await run_blocking("runway_prepare", prepare_image_for_runway, image_bytes)
+
+
+async def _build_spec(face_data: dict, spec_mode: Optional[str]) -> dict:
+    return await get_makeup_spec(face_data, spec_mode)
+
+
+async def _build_prompt(spec: dict) -> str:
+    return build_prompt_from_spec(MakeupSpec.parse_obj(spec))
+
+
+async def _generate_image(image_bytes, prompt: str, selfie_prepared: bytes) -> str:
+    return await image_to_image_async(image_bytes, prompt, prepared=selfie_prepared)
+
+
+GENERATE_LOOK_PIPELINE = Pipeline("generate_look", [
+    Stage("face_data", _face_data, deps=("image_bytes", "image_hash", "user")),
+    Stage("selfie_prepared", _prepare_selfie, deps=("image_bytes",)),
+    Stage("spec", _build_spec, deps=("face_data", "spec_mode")),
+    Stage("prompt", _build_prompt, deps=("spec",)),
+    Stage("image_url", _generate_image, deps=("image_bytes", "prompt", "selfie_prepared")),
+])
+
+# Стадии, результаты которых уходят клиенту в /generate-look/stream, и имена SSE-событий
+STREAMED_STAGES = {"face_data": "face_data", "spec": "spec", "prompt": "prompt", "image_url": "image"}
+
+
+def _pipeline_inputs(image_bytes, spec_mode, user) -> dict:
+    return {"image_bytes": image_bytes, "image_hash": sha256_hex(image_bytes), "spec_mode": spec_mode, "user": user}
+
+
+async def _save_look(run, user):
+    if run.results.get("image_url"):
+        await record_look(
+            user, "generate_look", run.results["image_hash"], run.results["image_url"],
+            prompt=run.results["prompt"], spec=run.results["spec"], face_data=run.results["face_data"],
+        )
+
+
+def _spec_mode_error(spec_mode: Optional[str]):
+    if spec_mode is not None and spec_mode not in SPEC_MODES:
+        return JSONResponse(status_code=400, content={"error": f"spec_mode must be one of {list(SPEC_MODES)}"})
+    return None
+
+
 @router.post("/generate-look")
 async def generate_ideal_makeup(
     image: UploadFile = File(...),
-    lang: Optional[str] = Form("en")
+    lang: Optional[str] = Form("en"),
+    spec_mode: Optional[str] = Form(None),  # "rules" (по умолчанию) или "creative" — через gpt-4
+    user: Optional[models.User] = Depends(get_optional_user)
 ):
-    try:
-        image_bytes = await image.read()
-        face_data = analyze_face(image_bytes)
+    error = _spec_mode_error(spec_mode)
+    if error is not None:
+        return error
 
-        spec_dict = generate_makeup_spec(face_data)
-        spec = MakeupSpec.parse_obj(spec_dict)
-        prompt = build_prompt_from_spec(spec)
-
-        image_url = image_to_image(image_bytes, prompt)
+    image_bytes = await read_upload(image)
+    try:
+        run = await GENERATE_LOOK_PIPELINE.run(_pipeline_inputs(image_bytes, spec_mode, user))
+        await _save_look(run, user)
 
         return {
-            "image_url": image_url,
-            "prompt": prompt,
-            "spec": spec_dict
+            "image_url": run.results["image_url"],
+            "prompt": run.results["prompt"],
+            "spec": run.results["spec"],
+            "timings_ms": run.timings_ms(),
         }
 
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
+
+
+@router.post("/generate-look/stream")
+async def generate_ideal_makeup_stream(
+    image: UploadFile = File(...),
+    lang: Optional[str] = Form("en"),
+    spec_mode: Optional[str] = Form(None),
+    user: Optional[models.User] = Depends(get_optional_user)
+):
+    """То же, что /generate-look, но анализ, спецификация и промпт приходят SSE-событиями до готовности изображения."""
+    error = _spec_mode_error(spec_mode)
+    if error is not None:
+        return error
+
+    image_bytes = await read_upload(image)
+
+    async def event_stream():
+        run = PipelineRun()
+        try:
+            async for stage, result in GENERATE_LOOK_PIPELINE.stream(_pipeline_inputs(image_bytes, spec_mode, user), run):
+                event = STREAMED_STAGES.get(stage)
+                if event is not None:
+                    yield f"event: {event}\ndata: {json.dumps({event: result}, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
+            return
+        await _save_look(run, user)
+        yield f"event: done\ndata: {json.dumps({'timings_ms': run.timings_ms()})}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
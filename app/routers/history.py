@@ -0,0 +1,43 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from app import models
+from app.auth import get_current_user
+from app.services.history import list_face_profiles, list_looks
+
+router = APIRouter(prefix="/users/me", tags=["history"])
+
+
+@router.get("/face-profiles")
+async def get_face_profiles(
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    landmarks: bool = False,
+    current_user: models.User = Depends(get_current_user),
+):
+    """Профили лица пользователя, новые первыми; next_cursor — для следующей страницы."""
+    try:
+        return await list_face_profiles(current_user.id, limit, cursor, include_landmarks=landmarks)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/face-profiles/latest")
+async def get_latest_face_profile(landmarks: bool = False, current_user: models.User = Depends(get_current_user)):
+    page = await list_face_profiles(current_user.id, 1, include_landmarks=landmarks)
+    if not page["items"]:
+        raise HTTPException(status_code=404, detail="No face profile yet")
+    return page["items"][0]
+
+
+@router.get("/looks")
+async def get_looks(
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    current_user: models.User = Depends(get_current_user),
+):
+    try:
+        return await list_looks(current_user.id, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,65 @@
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.runway_utils import RUNWAY_IMAGE_MODEL, RUNWAY_IMAGE_RATIO, start_image_task
+from app.services.generation_cache import generation_cache, generation_key
+from app.services.jobs import format_sse, job_manager
+from app.services.runway_poller import runway_poller
+from app.services.uploads import read_upload
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+
+async def run_image_generation(job, image_bytes, prompt: str) -> dict:
+    async def generate():
+        task_id = await start_image_task(image_bytes, prompt)
+        job_manager.update(job, task_id=task_id, provider_status="PENDING")
+
+        def on_progress(provider_status, progress):
+            job_manager.update(job, provider_status=provider_status, progress=progress or 0.0)
+
+        output = await runway_poller.wait(task_id, on_progress=on_progress)
+        job_manager.update(job, provider_status="SUCCEEDED")
+        return output[0]
+
+    def on_hit(url):
+        job_manager.update(job, provider_status="CACHED", progress=1.0)
+
+    key = generation_key(image_bytes, prompt, RUNWAY_IMAGE_MODEL, RUNWAY_IMAGE_RATIO)
+    image_url = await generation_cache.get_or_generate(key, generate, on_hit=on_hit)
+    return {"image_url": image_url, "prompt": prompt}
+
+
+@router.post("/generate-image", status_code=202)
+async def submit_image_generation(
+    image: UploadFile = File(...),
+    prompt: str = Form("natural makeup"),
+):
+    image_bytes = await read_upload(image)
+    job = job_manager.submit("image_generation", run_image_generation, image_bytes, prompt)
+    return {"job_id": job.id, "status": job.status}
+
+
+@router.get("/{job_id}")
+def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+@router.get("/{job_id}/events")
+async def stream_job_events(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        async for state in job_manager.events(job):
+            yield format_sse(state)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
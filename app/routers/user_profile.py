@@ -1,27 +1,30 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app import models, schemas
 from app.auth import get_current_user
-from app.database import get_db
+from app.database import get_async_db
+from app.services.user_cache import invalidate_user
 
 router = APIRouter()
 
 @router.put("/users/update")
-def update_user_profile(
+async def update_user_profile(
     user_update: schemas.UserUpdate,
     current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Заново загружаем пользователя из текущей сессии:
-    user_in_db = db.query(models.User).filter_by(id=current_user.id).first()
+    user_in_db = await db.get(models.User, current_user.id)
 
     if user_update.username != user_in_db.username:
-        existing_user = db.query(models.User).filter_by(username=user_update.username).first()
+        existing_user = await db.scalar(select(models.User).where(models.User.username == user_update.username))
         if existing_user:
             raise HTTPException(status_code=400, detail="Username already taken")
 
+    old_username = user_in_db.username
     user_in_db.username = user_update.username
-    db.commit()
-    db.refresh(user_in_db)
+    await db.commit()
+    invalidate_user(old_username, user_in_db.username)
 
     return {"message": "Profile updated successfully"}
@@ -1,50 +1,50 @@
-import os
-import io
 import base64
-from PIL import Image, ImageOps
-from dotenv import load_dotenv
-from runwayml import RunwayML, TaskFailedError
 
-load_dotenv()
-RUNWAY_API_TOKEN = os.getenv("RUNWAYML_API_SECRET")
+from app.providers import get_async_runway_client, get_runway_client
+from app.services import metrics
+from app.services.executor import run_blocking, stage_limit
+from app.services.generation_cache import generation_cache, generation_key
+from app.services.outbound_images import prepare_outbound
+from app.services.runway_poller import RunwayTaskError, runway_poller
 
-# Инициализируем клиента Runway
-client = RunwayML(api_key=RUNWAY_API_TOKEN)
+RUNWAY_IMAGE_MODEL = "gen4_image"
+RUNWAY_IMAGE_RATIO = "1920:1080"
+RUNWAY_VIDEO_MODEL = "gen4_turbo"
+RUNWAY_VIDEO_RATIO = "1280:720"
+RUNWAY_VIDEO_DURATION = 5
 
-# Подготовка изображения (с пэддингом по соотношению сторон)
+# Подготовка изображения: пэддинг по соотношению сторон, уменьшение до размера кадра,
+# JPEG без EXIF (см. app.services.outbound_images)
 def prepare_image_for_runway(image_bytes: bytes) -> bytes:
-    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    width, height = image.size
-    aspect_ratio = width / height
-    if 0.5 <= aspect_ratio <= 2.0:
-        return image_bytes
-    new_width = width
-    new_height = height
-    if aspect_ratio < 0.5:
-        new_width = int(height * 0.5)
-    elif aspect_ratio > 2.0:
-        new_height = int(width / 2.0)
-    padded = ImageOps.pad(image, (new_width, new_height), color=(255, 255, 255))
-    buf = io.BytesIO()
-    padded.save(buf, format="JPEG")
-    return buf.getvalue()
+    return prepare_outbound(image_bytes, "runway")
+
+# prepared — уже подготовленное изображение, если его сделали заранее (параллельно с другими стадиями)
+def build_image_data_uri(image_bytes: bytes, prepared: bytes = None) -> str:
+    prepared_image = prepared if prepared is not None else prepare_image_for_runway(image_bytes)
+    b64_image = base64.b64encode(prepared_image).decode("utf-8")
+    return f"data:image/jpeg;base64,{b64_image}"
+
+def build_image_task_params(image_bytes: bytes, prompt_text: str, prepared: bytes = None) -> dict:
+    image_data_uri = build_image_data_uri(image_bytes, prepared)
+
+    return {
+        "model": RUNWAY_IMAGE_MODEL,
+        "ratio": RUNWAY_IMAGE_RATIO,  # ✅ ОБЯЗАТЕЛЬНЫЙ параметр
+        "prompt_text": prompt_text,
+        "reference_images": [{
+            "uri": image_data_uri,
+            "tag": "user_selfie"
+        }],
+    }
 
 # Основная функция генерации изображения через text_to_image с reference
 def image_to_image(image_bytes: bytes, prompt_text: str = "natural makeup") -> str:
-    try:
-        prepared_image = prepare_image_for_runway(image_bytes)
-        b64_image = base64.b64encode(prepared_image).decode("utf-8")
-        image_data_uri = f"data:image/jpeg;base64,{b64_image}"
+    from runwayml import TaskFailedError
 
-        task = client.text_to_image.create(
-            model="gen4_image",
-            ratio="1920:1080",  # ✅ ОБЯЗАТЕЛЬНЫЙ параметр
-            prompt_text=prompt_text,
-            reference_images=[{
-                "uri": image_data_uri,
-                "tag": "user_selfie"
-            }],
-        ).wait_for_task_output()
+    try:
+        params = build_image_task_params(image_bytes, prompt_text)
+        with metrics.provider_call("runway", "image.generate"):
+            task = get_runway_client().text_to_image.create(**params).wait_for_task_output()
 
         print("✅ Runway image generated")
         return task.output[0]  # URL изображения
@@ -52,3 +52,64 @@ def image_to_image(image_bytes: bytes, prompt_text: str = "natural makeup") -> s
         print("❌ The image failed to generate.")
         print(e.task_details)
         return None
+
+# Запуск задачи без ожидания: возвращает id задачи Runway
+async def start_image_task(image_bytes: bytes, prompt_text: str = "natural makeup", prepared: bytes = None) -> str:
+    params = await run_blocking("runway_prepare", build_image_task_params, image_bytes, prompt_text, prepared)
+    async with stage_limit("runway"), metrics.provider_call("runway", "text_to_image.create"):
+        task = await get_async_runway_client().text_to_image.create(**params)
+    return task.id
+
+# Асинхронный вариант image_to_image: ожидание идёт через общий опросчик,
+# поэтому запрос не занимает поток на всё время генерации.
+# Повтор того же селфи с тем же промптом отдаётся из кэша генераций
+async def image_to_image_async(image_bytes: bytes, prompt_text: str = "natural makeup", on_progress=None, cache: bool = True,
+                               prepared: bytes = None) -> str:
+    # image.generate — полное время от подготовки селфи до готовой картинки, включая очередь Runway
+    @metrics.provider_call("runway", "image.generate")
+    async def generate():
+        task_id = await start_image_task(image_bytes, prompt_text, prepared)
+        output = await runway_poller.wait(task_id, on_progress=on_progress)
+        print("✅ Runway image generated")
+        return output[0]
+
+    try:
+        if not cache:
+            return await generate()
+        key = generation_key(image_bytes, prompt_text, RUNWAY_IMAGE_MODEL, RUNWAY_IMAGE_RATIO)
+        return await generation_cache.get_or_generate(key, generate)
+    except RunwayTaskError as e:
+        print("❌ The image failed to generate.")
+        print(e.details)
+        return None
+
+# Видео по селфи (image_to_video): кадр пользователя — первый кадр ролика
+async def start_video_task(image_bytes: bytes, prompt_text: str) -> str:
+    image_data_uri = await run_blocking("runway_prepare", build_image_data_uri, image_bytes)
+    async with stage_limit("runway"), metrics.provider_call("runway", "image_to_video.create"):
+        task = await get_async_runway_client().image_to_video.create(
+            model=RUNWAY_VIDEO_MODEL,
+            ratio=RUNWAY_VIDEO_RATIO,
+            duration=RUNWAY_VIDEO_DURATION,
+            prompt_image=image_data_uri,
+            prompt_text=prompt_text,
+        )
+    return task.id
+
+async def generate_video_from_image(image_bytes: bytes, prompt: str, cache: bool = True) -> str:
+    @metrics.provider_call("runway", "video.generate")
+    async def generate():
+        task_id = await start_video_task(image_bytes, prompt)
+        output = await runway_poller.wait(task_id)
+        print("✅ Runway video generated")
+        return output[0]
+
+    try:
+        if not cache:
+            return await generate()
+        key = generation_key(image_bytes, f"{RUNWAY_VIDEO_DURATION}s:{prompt}", RUNWAY_VIDEO_MODEL, RUNWAY_VIDEO_RATIO)
+        return await generation_cache.get_or_generate(key, generate)
+    except RunwayTaskError as e:
+        print("❌ The video failed to generate.")
+        print(e.details)
+        return None
@@ -23,6 +23,21 @@ class UserOut(BaseModel):
         from_attributes = True
 
 
+class FaceProfile(BaseModel):
+    skin_tone: str = "unknown"
+    undertone: str = "unknown"
+    average_rgb: Optional[List[int]] = None
+    eye_distance: str = "unknown"
+    face_shape: str = "unknown"
+    eye_shape: str = "unknown"
+    lip_shape: str = "unknown"
+    brow_shape: str = "unknown"
+    cheek_undertone: str = "unknown"
+    skin_type: str = "normal"
+    landmarks: Optional[List[List[float]]] = None
+    error: Optional[str] = None
+
+
 class FoundationSpec(BaseModel):
     tone: str  
     undertone: str  
@@ -0,0 +1,58 @@
+import os
+
+from app.services.cache import DiskCache, TieredCache, TTLCache, sha256_hex
+from app.services.executor import run_cpu_bound
+
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "512"))
+ANALYSIS_CACHE_TTL = float(os.getenv("ANALYSIS_CACHE_TTL", str(24 * 3600)))
+# Если задано — результаты дополнительно сохраняются на диск и переживают рестарт
+ANALYSIS_CACHE_DIR = os.getenv("ANALYSIS_CACHE_DIR")
+ANALYSIS_CACHE_DISK_MAX_MB = int(os.getenv("ANALYSIS_CACHE_DISK_MAX_MB", "512"))
+# "bytes" — ключ по байтам файла, "pixels" — по нормализованным пикселям
+# (одинаковое фото с другими метаданными или после пересохранения без потерь даст тот же ключ)
+ANALYSIS_CACHE_KEY = os.getenv("ANALYSIS_CACHE_KEY", "bytes")
+PIXEL_HASH_SIDE = 256
+# Меняется при изменении состава признаков, чтобы не отдавать устаревшие записи с диска
+ANALYSIS_VERSION = "2"
+
+analysis_cache = TieredCache(
+    TTLCache(max_entries=ANALYSIS_CACHE_SIZE, ttl=ANALYSIS_CACHE_TTL),
+    DiskCache(
+        ANALYSIS_CACHE_DIR,
+        ttl=ANALYSIS_CACHE_TTL,
+        max_bytes=ANALYSIS_CACHE_DISK_MAX_MB * 1024 * 1024,
+    ) if ANALYSIS_CACHE_DIR else None,
+)
+
+
+def pixel_hash(image_bytes) -> str:
+    from app.services.decoded_image import DecodedImage
+
+    try:
+        decoded = DecodedImage.from_bytes(image_bytes, max_side=PIXEL_HASH_SIDE)
+    except Exception:
+        return sha256_hex(image_bytes)
+    return sha256_hex(repr(decoded.rgb.shape).encode() + decoded.rgb.tobytes())
+
+
+async def image_cache_key(image_bytes) -> str:
+    if ANALYSIS_CACHE_KEY == "pixels":
+        return f"v{ANALYSIS_VERSION}:px:" + await run_cpu_bound("image_hash", pixel_hash, image_bytes)
+    return f"v{ANALYSIS_VERSION}:sha256:" + sha256_hex(image_bytes)
+
+
+async def analyze_face_cached(image_bytes) -> dict:
+    """
+    analyze_face с кэшем по содержимому изображения: повторная загрузка
+    того же селфи не платит ни за декодирование, ни за FaceMesh.
+    """
+    key = await image_cache_key(image_bytes)
+    cached = analysis_cache.get(key)
+    if cached is not None:
+        return dict(cached)
+
+    from app.face_analysis import analyze_face
+
+    result = await run_cpu_bound("face_analysis", analyze_face, image_bytes)
+    analysis_cache.set(key, result)
+    return dict(result)
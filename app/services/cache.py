@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def sha256_hex(data) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class TTLCache:
+    """Потокобезопасный LRU-кэш в памяти с ограничением по числу записей и TTL."""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at is not None and expires_at < time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DiskCache:
+    """
+    Кэш на диске: одна JSON-запись на ключ. При превышении max_bytes
+    удаляются самые старые по времени изменения файлы.
+    """
+
+    def __init__(self, directory: str, ttl: float = None, max_bytes: int = None):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._size = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        name = sha256_hex(key.encode())
+        return os.path.join(self.directory, name[:2], f"{name}.json")
+
+    def get(self, key: str, default=None):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                item = json.load(f)
+        except (OSError, ValueError):
+            return default
+
+        expires_at = item.get("expires_at")
+        if expires_at is not None and expires_at < time.time():
+            self.delete(key)
+            return default
+        return item["value"]
+
+    def set(self, key: str, value, ttl: float = None):
+        ttl = self.ttl if ttl is None else ttl
+        item = {"expires_at": time.time() + ttl if ttl else None, "value": value}
+        payload = json.dumps(item, ensure_ascii=False).encode("utf-8")
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+        if self.max_bytes:
+            with self._lock:
+                if self._size is None:
+                    self._size = self._scan_size()
+                else:
+                    self._size += len(payload)
+                if self._size > self.max_bytes:
+                    self._evict()
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _files(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield stat.st_mtime, stat.st_size, path
+
+    def _scan_size(self) -> int:
+        return sum(size for _, size, _ in self._files())
+
+    def _evict(self):
+        # Чистим до 90% лимита, чтобы не запускать обход директории на каждой записи
+        target = int(self.max_bytes * 0.9)
+        files = sorted(self._files())
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._size = total
+
+
+class TieredCache:
+    """LRU в памяти поверх необязательного дискового уровня, со счётчиками попаданий."""
+
+    def __init__(self, memory: TTLCache, disk: DiskCache = None):
+        self.memory = memory
+        self.disk = disk
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key: str, default=None):
+        value = self.memory.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.hits += 1
+                self.disk_hits += 1
+                self.memory.set(key, value)
+                return value
+
+        self.misses += 1
+        return default
+
+    def set(self, key: str, value, ttl: float = None):
+        self.memory.set(key, value, ttl)
+        if self.disk is not None:
+            self.disk.set(key, value, ttl)
+
+    def delete(self, key: str):
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "entries": len(self.memory),
+        }
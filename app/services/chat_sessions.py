@@ -0,0 +1,200 @@
+"""
+Серверные сессии бьюти-чата.
+
+История хранится на сервере по id сессии (id лежит в cookie SessionMiddleware
+или приходит в запросе). Id выдаёт только сервер, и сессия привязана к владельцу —
+пользователю или анонимной подписанной cookie, — чужой id не принимается. Когда реплики не помещаются в CHAT_CONTEXT_TOKENS,
+старые сворачиваются в краткое содержание. Системный промпт и summary
+идут первыми и меняются только при сжатии, поэтому префикс запроса
+стабилен и переиспользуется кэшем промптов OpenAI.
+"""
+import asyncio
+import os
+import uuid
+
+from fastapi import HTTPException
+
+from app.services.cache import TTLCache
+from app.services.llm_gateway import chat_completion
+
+CHAT_SESSION_TTL = float(os.getenv("CHAT_SESSION_TTL", str(24 * 3600)))
+CHAT_SESSION_MAX = int(os.getenv("CHAT_SESSION_MAX", "10000"))
+# Бюджет токенов на историю реплик (без системного промпта и summary)
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "1500"))
+# Сколько последних сообщений всегда остаются дословно
+CHAT_KEEP_MESSAGES = int(os.getenv("CHAT_KEEP_MESSAGES", "4"))
+CHAT_SUMMARY_MODEL = os.getenv("CHAT_SUMMARY_MODEL", "gpt-3.5-turbo")
+
+SESSION_COOKIE_KEY = "chat_session_id"
+# Случайный ключ анонимного владельца сессий (в подписанной cookie SessionMiddleware)
+OWNER_COOKIE_KEY = "chat_owner"
+
+SUMMARY_SYSTEM_PROMPT = (
+    "Сожми диалог пользователя с визажистом в краткое содержание до 120 слов. "
+    "Сохрани факты о пользователе (тип и тон кожи, предпочтения, аллергии), "
+    "заданные вопросы и данные советы. Пиши от третьего лица, без вступлений."
+)
+
+
+def estimate_tokens(text: str) -> int:
+    # Грубая оценка: ~4 символа на токен плюс служебные токены сообщения
+    return len(text) // 4 + 4
+
+
+class ChatSessionForbidden(Exception):
+    def __init__(self, session_id: str):
+        super().__init__(f"Chat session {session_id} belongs to another owner")
+        self.session_id = session_id
+
+
+class ChatSession:
+    def __init__(self, session_id: str, owner: str):
+        self.id = session_id
+        self.owner = owner
+        self.summary = ""
+        self.turns = []
+        self.lock = asyncio.Lock()
+        self.compacting = None
+
+    def history_tokens(self) -> int:
+        return sum(estimate_tokens(turn["content"]) for turn in self.turns)
+
+    def build_messages(self, system_prompt: str, message: str) -> list:
+        messages = [{"role": "system", "content": system_prompt}]
+        if self.summary:
+            messages.append({"role": "system", "content": f"Краткое содержание предыдущего диалога: {self.summary}"})
+        messages.extend(self.turns)
+        messages.append({"role": "user", "content": message})
+        return messages
+
+    def append(self, message: str, reply: str):
+        self.turns.append({"role": "user", "content": message})
+        self.turns.append({"role": "assistant", "content": reply})
+
+    def needs_compaction(self) -> bool:
+        return len(self.turns) > CHAT_KEEP_MESSAGES and self.history_tokens() > CHAT_CONTEXT_TOKENS
+
+    async def compact(self):
+        """
+        Сворачивает старые реплики в summary. Сжимаем с запасом (до половины бюджета),
+        чтобы префикс запроса менялся редко.
+        """
+        async with self.lock:
+            if not self.needs_compaction():
+                return
+            keep = len(self.turns)
+            tokens = self.history_tokens()
+            while keep > CHAT_KEEP_MESSAGES and tokens > CHAT_CONTEXT_TOKENS // 2:
+                tokens -= estimate_tokens(self.turns[len(self.turns) - keep]["content"])
+                keep -= 1
+            # Не разрываем пару вопрос-ответ
+            if keep % 2:
+                keep += 1
+            old_turns = self.turns[:len(self.turns) - keep]
+            if not old_turns:
+                return
+
+            dialogue = "\n".join(f"{turn['role']}: {turn['content']}" for turn in old_turns)
+            if self.summary:
+                dialogue = f"Предыдущее краткое содержание: {self.summary}\n\n{dialogue}"
+            try:
+                summary = await chat_completion(
+                    model=CHAT_SUMMARY_MODEL,
+                    messages=[
+                        {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                        {"role": "user", "content": dialogue},
+                    ],
+                    temperature=0,
+                    cache=False,
+                )
+            except Exception as e:
+                # История остаётся как есть, попробуем сжать после следующей реплики
+                print(f"⚠️ Chat session compaction failed: {e}")
+                return
+            self.summary = summary.strip()
+            self.turns = self.turns[len(old_turns):]
+            print(f"🗜️ Chat session {self.id}: {len(old_turns)} messages folded into summary")
+
+    def schedule_compaction(self):
+        # Сжатие идёт в фоне и не задерживает текущий ответ; следующая реплика дождётся его на lock
+        if self.compacting is None and self.needs_compaction():
+            self.compacting = asyncio.create_task(self.compact())
+            self.compacting.add_done_callback(self._compaction_done)
+
+    def _compaction_done(self, task):
+        self.compacting = None
+
+
+class ChatSessionStore:
+    def __init__(self, max_sessions: int = CHAT_SESSION_MAX, ttl: float = CHAT_SESSION_TTL):
+        self._sessions = TTLCache(max_entries=max_sessions, ttl=ttl)
+
+    def get_or_create(self, session_id: str, owner: str) -> ChatSession:
+        session = self._sessions.get(session_id) if session_id else None
+        if session is None:
+            # Незнакомый id клиента не берём: иначе сессию с заранее известным id можно подсунуть другому
+            session = ChatSession(uuid.uuid4().hex, owner)
+        elif session.owner != owner:
+            raise ChatSessionForbidden(session_id)
+        # Продлеваем TTL при каждом обращении
+        self._sessions.set(session.id, session)
+        return session
+
+    def reset(self, session_id: str, owner: str) -> bool:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return False
+        if session.owner != owner:
+            raise ChatSessionForbidden(session_id)
+        self._sessions.delete(session_id)
+        return True
+
+    def stats(self) -> dict:
+        return {"sessions": len(self._sessions)}
+
+
+chat_sessions = ChatSessionStore()
+
+
+def session_owner(request, user=None) -> str:
+    """Владелец сессий: вошедший пользователь или анонимный ключ из cookie."""
+    if user is not None:
+        return f"user:{user.id}"
+    owner = request.session.get(OWNER_COOKIE_KEY)
+    if owner is None:
+        owner = uuid.uuid4().hex
+        request.session[OWNER_COOKIE_KEY] = owner
+    return f"anon:{owner}"
+
+
+def _forbidden():
+    return HTTPException(status_code=403, detail="Chat session belongs to another user")
+
+
+def resolve_session(request, session_id: str = None, user=None) -> ChatSession:
+    """Сессия по явному id или по cookie; id новой сессии запоминается в cookie."""
+    owner = session_owner(request, user)
+    if session_id:
+        try:
+            session = chat_sessions.get_or_create(session_id, owner)
+        except ChatSessionForbidden:
+            raise _forbidden()
+    else:
+        try:
+            session = chat_sessions.get_or_create(request.session.get(SESSION_COOKIE_KEY), owner)
+        except ChatSessionForbidden:
+            # В cookie осталась сессия другого владельца (например, анонимная до входа) — начинаем новую
+            session = chat_sessions.get_or_create(None, owner)
+    request.session[SESSION_COOKIE_KEY] = session.id
+    return session
+
+
+def reset_session(request, session_id: str = None, user=None) -> bool:
+    """Сбрасывает сессию по явному id или по cookie; чужую сессию сбросить нельзя."""
+    session_id = session_id or request.session.pop(SESSION_COOKIE_KEY, None)
+    if not session_id:
+        return False
+    try:
+        return chat_sessions.reset(session_id, session_owner(request, user))
+    except ChatSessionForbidden:
+        raise _forbidden()
@@ -0,0 +1,57 @@
+import io
+import os
+
+import numpy as np
+from PIL import Image, ImageOps
+
+# FaceMesh работает на 256–640 px, декодировать 12-мегапиксельные селфи целиком незачем
+INFERENCE_MAX_SIDE = int(os.getenv("INFERENCE_MAX_SIDE", "640"))
+
+# EXIF-ориентации, при которых ширина и высота меняются местами
+_TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+class DecodedImage:
+    """
+    Изображение, декодированное один раз на запрос.
+
+    Хранит исходные байты (они нужны только для отправки провайдерам),
+    размеры оригинала с учётом EXIF-ориентации и уменьшенную RGB-копию
+    в виде numpy-массива для инференса и выборки цвета кожи.
+    """
+
+    def __init__(self, data, rgb: np.ndarray, width: int, height: int, format: str = None):
+        self.data = data
+        self.rgb = rgb
+        self.width = width
+        self.height = height
+        self.format = format
+
+    @classmethod
+    def from_bytes(cls, data, max_side: int = INFERENCE_MAX_SIDE) -> "DecodedImage":
+        image = Image.open(io.BytesIO(data))
+        width, height = image.size
+        image_format = image.format
+        orientation = image.getexif().get(0x0112, 1)
+
+        if image_format == "JPEG":
+            # JPEG умеет декодироваться сразу в 1/2, 1/4 или 1/8 размера
+            image.draft("RGB", (max_side, max_side))
+
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        image.thumbnail((max_side, max_side), Image.BILINEAR)
+
+        if orientation in _TRANSPOSED_ORIENTATIONS:
+            width, height = height, width
+
+        return cls(data, np.asarray(image), width, height, image_format)
+
+    @property
+    def scale(self) -> float:
+        """Во сколько раз уменьшенная копия меньше оригинала."""
+        return self.rgb.shape[1] / self.width
+
+    def crop_relative(self, left: float, top: float, right: float, bottom: float) -> np.ndarray:
+        """Возвращает срез (без копирования) уменьшенной копии по относительным координатам."""
+        h, w, _ = self.rgb.shape
+        return self.rgb[int(h * top):int(h * bottom), int(w * left):int(w * right)]
@@ -0,0 +1,148 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from app.services import metrics
+
+# Количество процессов для анализа лица (CPU). 0 — выполнять в пуле потоков,
+# удобно для локальной разработки с --reload.
+FACE_ANALYSIS_PROCESSES = int(os.getenv("FACE_ANALYSIS_PROCESSES", "2"))
+# Потоки для блокирующих вызовов внешних провайдеров (Runway, OpenAI)
+BLOCKING_IO_THREADS = int(os.getenv("BLOCKING_IO_THREADS", "32"))
+# Отдельные потоки для bcrypt: хэширование пароля не должно занимать пул I/O
+PASSWORD_HASH_THREADS = int(os.getenv("PASSWORD_HASH_THREADS", str(min(os.cpu_count() or 2, 4))))
+
+# Сколько задач каждого этапа одновременно может выполняться в одном воркере
+DEFAULT_STAGE_LIMIT = int(os.getenv("STAGE_LIMIT_DEFAULT", "8"))
+STAGE_LIMITS = {
+    "face_analysis": int(os.getenv("STAGE_LIMIT_FACE_ANALYSIS", str(max(FACE_ANALYSIS_PROCESSES, 1) * 2))),
+    "runway": int(os.getenv("STAGE_LIMIT_RUNWAY", "8")),
+}
+
+_process_pool = None
+_thread_pool = None
+_password_hash_pool = None
+_semaphores = {}
+
+
+def _init_face_analysis_worker():
+    # Каждый процесс обрабатывает одну задачу за раз — одного FaceMesh достаточно
+    from app.providers import get_face_mesh_pool
+    face_mesh_pool = get_face_mesh_pool()
+    face_mesh_pool.size = 1
+    face_mesh_pool.warm_up()
+
+
+def _warm_up_worker():
+    from app import providers
+    return providers.startup_timings()
+
+
+def get_process_pool():
+    global _process_pool
+    if _process_pool is None and FACE_ANALYSIS_PROCESSES > 0:
+        # spawn, а не fork: mediapipe и TFLite не переживают fork из процесса с потоками
+        _process_pool = ProcessPoolExecutor(
+            max_workers=FACE_ANALYSIS_PROCESSES,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_face_analysis_worker,
+        )
+    return _process_pool
+
+
+def get_thread_pool():
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(max_workers=BLOCKING_IO_THREADS, thread_name_prefix="blocking-io")
+    return _thread_pool
+
+
+def get_password_hash_pool():
+    global _password_hash_pool
+    if _password_hash_pool is None:
+        _password_hash_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_THREADS, thread_name_prefix="password-hash")
+    return _password_hash_pool
+
+
+def _get_semaphore(stage: str) -> asyncio.Semaphore:
+    semaphore = _semaphores.get(stage)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(STAGE_LIMITS.get(stage, DEFAULT_STAGE_LIMIT))
+        _semaphores[stage] = semaphore
+    return semaphore
+
+
+def stage_limit(stage: str):
+    """Слот этапа для нативно асинхронных вызовов: async with stage_limit("runway")."""
+    return metrics.slot(_get_semaphore(stage), stage)
+
+
+async def _run(executor, stage: str, fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    async with stage_limit(stage):
+        metrics.executor_tasks_running.inc(stage=stage)
+        try:
+            with metrics.timed(metrics.executor_task_seconds, stage=stage):
+                return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            metrics.executor_tasks_running.dec(stage=stage)
+
+
+def _picklable(value):
+    # memoryview нельзя передать в другой процесс — копируем только на этой границе
+    return bytes(value) if isinstance(value, memoryview) else value
+
+
+def _call_with_metrics(fn, *args, **kwargs):
+    # Метрики, записанные в процессе-воркере, возвращаются вместе с результатом
+    return fn(*args, **kwargs), metrics.registry.drain()
+
+
+async def run_cpu_bound(stage: str, fn, *args, **kwargs):
+    """Выполняет CPU-тяжёлую функцию в пуле процессов, не блокируя event loop."""
+    executor = get_process_pool()
+    if executor is None:
+        return await _run(get_thread_pool(), stage, fn, *args, **kwargs)
+    args = [_picklable(arg) for arg in args]
+    kwargs = {key: _picklable(value) for key, value in kwargs.items()}
+    result, worker_metrics = await _run(executor, stage, _call_with_metrics, fn, *args, **kwargs)
+    metrics.registry.merge(worker_metrics)
+    return result
+
+
+async def run_blocking(stage: str, fn, *args, **kwargs):
+    """Выполняет блокирующий I/O-вызов (SDK провайдеров) в ограниченном пуле потоков."""
+    return await _run(get_thread_pool(), stage, fn, *args, **kwargs)
+
+
+async def warm_up():
+    """Поднимает процессы анализа лица заранее, чтобы они успели загрузить FaceMesh."""
+    process_pool = get_process_pool()
+    loop = asyncio.get_running_loop()
+    if process_pool is None:
+        from app.providers import get_face_mesh_pool
+        await loop.run_in_executor(get_thread_pool(), get_face_mesh_pool().warm_up)
+        return
+    from app import providers
+
+    worker_timings = await asyncio.gather(*(
+        loop.run_in_executor(process_pool, _warm_up_worker)
+        for _ in range(FACE_ANALYSIS_PROCESSES)
+    ))
+    for timings in worker_timings:
+        providers.merge_startup_timings(timings, prefix="face_analysis_worker")
+
+
+def shutdown():
+    global _process_pool, _thread_pool, _password_hash_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+    if _thread_pool is not None:
+        _thread_pool.shutdown(wait=False, cancel_futures=True)
+        _thread_pool = None
+    if _password_hash_pool is not None:
+        _password_hash_pool.shutdown(wait=False, cancel_futures=True)
+        _password_hash_pool = None
@@ -0,0 +1,107 @@
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from app import providers
+
+# Сколько экземпляров FaceMesh держать в памяти процесса.
+# По умолчанию — по одному на поток, который может одновременно анализировать лицо.
+FACE_MESH_POOL_SIZE = int(os.getenv("FACE_MESH_POOL_SIZE", "2"))
+FACE_MESH_CHECKOUT_TIMEOUT = float(os.getenv("FACE_MESH_CHECKOUT_TIMEOUT", "30"))
+
+
+class FaceMeshPool:
+    """
+    Пул заранее загруженных моделей FaceMesh.
+
+    Загрузка TFLite-графа дороже самого инференса, поэтому модели создаются
+    один раз и переиспользуются: checkout() выдаёт свободный экземпляр,
+    а по выходу из блока with возвращает его обратно в пул.
+    """
+
+    def __init__(self, size: int = FACE_MESH_POOL_SIZE, checkout_timeout: float = FACE_MESH_CHECKOUT_TIMEOUT):
+        self.size = max(1, size)
+        self.checkout_timeout = checkout_timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _create(self):
+        with providers.record_startup("mediapipe"):
+            import mediapipe as mp
+        return mp.solutions.face_mesh.FaceMesh(
+            static_image_mode=True,
+            max_num_faces=1,
+            refine_landmarks=True,
+        )
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+
+        if create:
+            try:
+                return self._create()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=self.checkout_timeout)
+        except queue.Empty:
+            raise TimeoutError("No FaceMesh instance became available in time")
+
+    def _discard(self, face_mesh):
+        with self._lock:
+            self._created -= 1
+        try:
+            face_mesh.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def checkout(self):
+        face_mesh = self._acquire()
+        try:
+            yield face_mesh
+        except Exception:
+            # Граф мог остаться в неконсистентном состоянии — не возвращаем его в пул
+            self._discard(face_mesh)
+            raise
+        else:
+            self._idle.put(face_mesh)
+
+    def warm_up(self):
+        """Создаёт все экземпляры пула и прогоняет через каждый пустой кадр."""
+        blank = np.zeros((256, 256, 3), dtype=np.uint8)
+        instances = []
+        try:
+            with providers.record_startup("face_mesh_warm_up"):
+                for _ in range(self.size):
+                    instances.append(self._acquire())
+                for face_mesh in instances:
+                    face_mesh.process(blank)
+        finally:
+            for face_mesh in instances:
+                self._idle.put(face_mesh)
+
+    def close(self):
+        while True:
+            try:
+                face_mesh = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(face_mesh)
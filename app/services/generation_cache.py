@@ -0,0 +1,108 @@
+"""
+Кэш результатов генерации Runway.
+
+Ключ — (хэш изображения, хэш промпта, модель, соотношение сторон), значение —
+URL результата. Ссылки Runway временные, поэтому TTL должен быть меньше срока
+их жизни. Одинаковые одновременные задачи схлопываются в одну.
+"""
+import asyncio
+import os
+import time
+
+from app.services.cache import DiskCache, TieredCache, TTLCache, sha256_hex
+
+GENERATION_CACHE_SIZE = int(os.getenv("GENERATION_CACHE_SIZE", "1024"))
+GENERATION_CACHE_TTL = float(os.getenv("GENERATION_CACHE_TTL", str(12 * 3600)))
+# Если задано — результаты дополнительно сохраняются на диск и переживают рестарт
+GENERATION_CACHE_DIR = os.getenv("GENERATION_CACHE_DIR")
+GENERATION_CACHE_DISK_MAX_MB = int(os.getenv("GENERATION_CACHE_DISK_MAX_MB", "64"))
+
+
+def generation_key(image_bytes, prompt: str, model: str, ratio: str) -> str:
+    return f"gen:{model}:{ratio}:{sha256_hex(image_bytes)}:{sha256_hex(prompt.encode('utf-8'))}"
+
+
+def _retrieve_exception(task: asyncio.Task):
+    # Если все ожидающие ушли, ошибка генерации не должна всплывать как "never retrieved"
+    if not task.cancelled():
+        task.exception()
+
+
+class GenerationCache:
+    def __init__(self, cache: TieredCache):
+        self.cache = cache
+        self._inflight = {}
+        self.generations = 0
+        self.coalesced = 0
+        self.generation_seconds = 0.0
+        self.seconds_saved = 0.0
+
+    def get(self, key: str):
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        self.seconds_saved += entry.get("seconds", 0.0)
+        return entry["url"]
+
+    async def get_or_generate(self, key: str, producer, on_hit=None) -> str:
+        """
+        producer — корутина-фабрика, возвращающая URL. Пустой результат не кэшируется.
+        on_hit(url) вызывается, если генерация не понадобилась.
+        """
+        url = self.get(key)
+        if url is not None:
+            if on_hit is not None:
+                on_hit(url)
+            return url
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            url = await asyncio.shield(task)
+            if on_hit is not None and url:
+                on_hit(url)
+            return url
+
+        # Генерация идёт в своей задаче: отключение клиента, начавшего её,
+        # не отменяет ни её, ни ожидание остальных клиентов с тем же ключом
+        task = asyncio.ensure_future(self._generate(key, producer))
+        task.add_done_callback(_retrieve_exception)
+        self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _generate(self, key: str, producer) -> str:
+        started = time.perf_counter()
+        try:
+            url = await producer()
+        finally:
+            self._inflight.pop(key, None)
+        seconds = time.perf_counter() - started
+        self.generations += 1
+        self.generation_seconds += seconds
+        if url:
+            self.cache.set(key, {"url": url, "seconds": round(seconds, 2), "created_at": time.time()})
+        return url
+
+    def stats(self) -> dict:
+        cache_stats = self.cache.stats()
+        return {
+            **cache_stats,
+            "generations": self.generations,
+            "coalesced": self.coalesced,
+            "avoided": cache_stats["hits"] + self.coalesced,
+            "avg_generation_s": round(self.generation_seconds / self.generations, 2) if self.generations else 0.0,
+            "seconds_saved": round(self.seconds_saved, 1),
+            "in_flight": len(self._inflight),
+        }
+
+
+generation_cache = GenerationCache(
+    TieredCache(
+        TTLCache(max_entries=GENERATION_CACHE_SIZE, ttl=GENERATION_CACHE_TTL),
+        DiskCache(
+            GENERATION_CACHE_DIR,
+            ttl=GENERATION_CACHE_TTL,
+            max_bytes=GENERATION_CACHE_DISK_MAX_MB * 1024 * 1024,
+        ) if GENERATION_CACHE_DIR else None,
+    )
+)
@@ -0,0 +1,165 @@
+"""
+История пользователя: профили лица и сгенерированные образы.
+
+Повторный визит с тем же селфи берёт признаки из БД вместо FaceMesh,
+а прошлые образы отдаются списком с keyset-пагинацией по (created_at, id).
+"""
+import base64
+import json
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import and_, or_, select
+
+from app import models
+from app.database import AsyncSessionLocal
+
+HISTORY_PAGE_MAX = 100
+
+
+def encode_landmarks(landmarks) -> bytes:
+    return np.asarray(landmarks, dtype=np.float32).tobytes()
+
+
+def decode_landmarks(data: bytes) -> list:
+    return np.frombuffer(data, dtype=np.float32).reshape(-1, 3).tolist()
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), row_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """(created_at, id) из курсора; ValueError, если курсор испорчен."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def face_profile_to_dict(record: models.FaceProfileRecord, include_landmarks: bool = False) -> dict:
+    result = {
+        "id": record.id,
+        "image_hash": record.image_hash,
+        "created_at": record.created_at.isoformat(),
+        **record.features,
+    }
+    if include_landmarks and record.landmarks is not None:
+        result["landmarks"] = decode_landmarks(record.landmarks)
+    return result
+
+
+def look_to_dict(record: models.LookRecord) -> dict:
+    return {
+        "id": record.id,
+        "kind": record.kind,
+        "face_profile_id": record.face_profile_id,
+        "image_hash": record.image_hash,
+        "spec": record.spec,
+        "prompt": record.prompt,
+        "image_url": record.image_url,
+        "created_at": record.created_at.isoformat(),
+    }
+
+
+async def find_face_profile(user_id: int, image_hash: str):
+    async with AsyncSessionLocal() as db:
+        return await db.scalar(
+            select(models.FaceProfileRecord)
+            .where(models.FaceProfileRecord.user_id == user_id, models.FaceProfileRecord.image_hash == image_hash)
+            .order_by(models.FaceProfileRecord.created_at.desc())
+            .limit(1)
+        )
+
+
+async def load_face_data(user_id: int, image_hash: str):
+    """Признаки (с точками) ранее проанализированного селфи или None."""
+    record = await find_face_profile(user_id, image_hash)
+    if record is None:
+        return None
+    features = dict(record.features)
+    if record.landmarks is not None:
+        features["landmarks"] = decode_landmarks(record.landmarks)
+    return features
+
+
+async def save_face_profile(user_id: int, image_hash: str, face_data: dict):
+    """Сохраняет анализ, если для этого изображения его ещё нет. Возвращает id записи."""
+    if "landmarks" not in face_data and "error" in face_data:
+        return None
+    existing = await find_face_profile(user_id, image_hash)
+    if existing is not None:
+        return existing.id
+
+    features = {key: value for key, value in face_data.items() if key != "landmarks"}
+    landmarks = face_data.get("landmarks")
+    record = models.FaceProfileRecord(
+        user_id=user_id,
+        image_hash=image_hash,
+        features=features,
+        landmarks=encode_landmarks(landmarks) if landmarks is not None else None,
+    )
+    async with AsyncSessionLocal() as db:
+        db.add(record)
+        await db.commit()
+        return record.id
+
+
+async def record_look(user, kind: str, image_hash: str, image_url: str, prompt: str = None,
+                      spec: dict = None, face_data: dict = None):
+    """Сохраняет образ (и профиль лица, если он есть) в историю пользователя."""
+    if user is None:
+        return None
+    try:
+        face_profile_id = await save_face_profile(user.id, image_hash, face_data) if face_data else None
+        record = models.LookRecord(
+            user_id=user.id,
+            face_profile_id=face_profile_id,
+            image_hash=image_hash,
+            kind=kind,
+            spec=spec,
+            prompt=prompt,
+            image_url=image_url,
+        )
+        async with AsyncSessionLocal() as db:
+            db.add(record)
+            await db.commit()
+            return record.id
+    except Exception as e:
+        # История не должна ломать основной ответ
+        print(f"⚠️ Failed to save look history: {e}")
+        return None
+
+
+async def _list_page(model, user_id: int, limit: int, cursor: str = None) -> tuple:
+    limit = max(1, min(limit, HISTORY_PAGE_MAX))
+    query = select(model).where(model.user_id == user_id)
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.where(or_(
+            model.created_at < created_at,
+            and_(model.created_at == created_at, model.id < row_id),
+        ))
+    query = query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1)
+
+    async with AsyncSessionLocal() as db:
+        rows = list((await db.scalars(query)).all())
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return rows, next_cursor
+
+
+async def list_face_profiles(user_id: int, limit: int = 20, cursor: str = None, include_landmarks: bool = False) -> dict:
+    rows, next_cursor = await _list_page(models.FaceProfileRecord, user_id, limit, cursor)
+    return {"items": [face_profile_to_dict(row, include_landmarks) for row in rows], "next_cursor": next_cursor}
+
+
+async def list_looks(user_id: int, limit: int = 20, cursor: str = None) -> dict:
+    rows, next_cursor = await _list_page(models.LookRecord, user_id, limit, cursor)
+    return {"items": [look_to_dict(row) for row in rows], "next_cursor": next_cursor}
@@ -0,0 +1,210 @@
+import re
+import threading
+
+from sqlalchemy.exc import IntegrityError
+
+from app import models
+from app.database import SessionLocal
+
+CATEGORIES = ("comedogenic", "safe", "unknown")
+
+# Синонимы, под которыми один и тот же ингредиент встречается в составах
+ALIASES = {
+    "aqua": "water",
+    "eau": "water",
+    "purified water": "water",
+    "parfum": "fragrance",
+    "perfume": "fragrance",
+    "glycerine": "glycerin",
+    "vitamin e": "tocopherol",
+    "vitamin b3": "niacinamide",
+    "provitamin b5": "panthenol",
+    "d-panthenol": "panthenol",
+    "hyaluronic acid": "sodium hyaluronate",
+    "aloe vera": "aloe barbadensis leaf juice",
+    "shea butter": "butyrospermum parkii butter",
+    "cocos nucifera oil": "coconut oil",
+    "theobroma cacao seed butter": "cocoa butter",
+    "alcohol": "alcohol denat",
+    "ci 77891": "titanium dioxide",
+    "ci 77947": "zinc oxide",
+}
+
+# Базовые знания о частых ингредиентах: их не нужно спрашивать у модели
+SEED_INGREDIENTS = {
+    "water": ("safe", "Растворитель, основа большинства средств"),
+    "glycerin": ("safe", "Увлажнитель, удерживает воду в коже"),
+    "dimethicone": ("safe", "Силикон, смягчает и выравнивает, не комедогенен"),
+    "cyclopentasiloxane": ("safe", "Летучий силикон, улучшает распределение средства"),
+    "niacinamide": ("safe", "Витамин B3, укрепляет барьер и выравнивает тон"),
+    "sodium hyaluronate": ("safe", "Гиалуроновая кислота, глубоко увлажняет"),
+    "panthenol": ("safe", "Провитамин B5, успокаивает и увлажняет"),
+    "allantoin": ("safe", "Успокаивает раздражение"),
+    "squalane": ("safe", "Лёгкое эмолентное масло, не забивает поры"),
+    "tocopherol": ("safe", "Витамин E, антиоксидант"),
+    "butylene glycol": ("safe", "Увлажнитель и растворитель"),
+    "propylene glycol": ("safe", "Увлажнитель, редко раздражает чувствительную кожу"),
+    "caprylic/capric triglyceride": ("safe", "Лёгкий эмолент из кокосового масла, низкая комедогенность"),
+    "cetearyl alcohol": ("safe", "Жирный спирт, загуститель, не сушит кожу"),
+    "cetyl alcohol": ("safe", "Жирный спирт, смягчает и загущает"),
+    "phenoxyethanol": ("safe", "Консервант, безопасен в разрешённой концентрации"),
+    "ethylhexylglycerin": ("safe", "Кондиционер и усилитель консервантов"),
+    "xanthan gum": ("safe", "Загуститель натурального происхождения"),
+    "carbomer": ("safe", "Гелеобразователь"),
+    "citric acid": ("safe", "Регулятор pH"),
+    "sodium hydroxide": ("safe", "Регулятор pH в малых количествах"),
+    "sodium benzoate": ("safe", "Консервант"),
+    "potassium sorbate": ("safe", "Консервант"),
+    "disodium edta": ("safe", "Стабилизатор формулы"),
+    "betaine": ("safe", "Мягкий увлажнитель"),
+    "urea": ("safe", "Увлажняет и смягчает в низких концентрациях"),
+    "titanium dioxide": ("safe", "Минеральный УФ-фильтр и пигмент"),
+    "zinc oxide": ("safe", "Минеральный УФ-фильтр, успокаивает кожу"),
+    "ceramide np": ("safe", "Церамид, восстанавливает защитный барьер"),
+    "aloe barbadensis leaf juice": ("safe", "Сок алоэ, успокаивает и увлажняет"),
+    "butyrospermum parkii butter": ("safe", "Масло ши, питает, низкая комедогенность"),
+    "coconut oil": ("comedogenic", "Высокая комедогенность, может забивать поры"),
+    "cocoa butter": ("comedogenic", "Масло какао, высокая комедогенность"),
+    "isopropyl myristate": ("comedogenic", "Эмолент с высокой комедогенностью"),
+    "isopropyl palmitate": ("comedogenic", "Эмолент, часто провоцирует закупорку пор"),
+    "isopropyl isostearate": ("comedogenic", "Эмолент с высокой комедогенностью"),
+    "myristyl myristate": ("comedogenic", "Эмолент, склонен забивать поры"),
+    "laureth-4": ("comedogenic", "Эмульгатор с высокой комедогенностью"),
+    "lanolin": ("comedogenic", "Ланолин, может забивать поры"),
+    "acetylated lanolin": ("comedogenic", "Производное ланолина, высокая комедогенность"),
+    "wheat germ oil": ("comedogenic", "Масло зародышей пшеницы, высокая комедогенность"),
+    "linseed oil": ("comedogenic", "Льняное масло, высокая комедогенность"),
+    "algae extract": ("comedogenic", "Экстракт водорослей, может забивать поры"),
+    "ethylhexyl palmitate": ("comedogenic", "Эмолент, умеренно комедогенен"),
+    "sodium lauryl sulfate": ("unknown", "Агрессивный ПАВ, может раздражать и сушить кожу"),
+    "fragrance": ("unknown", "Отдушка, частый аллерген для чувствительной кожи"),
+    "alcohol denat": ("unknown", "Денатурированный спирт, может сушить кожу"),
+    "limonene": ("unknown", "Компонент отдушки, возможный аллерген"),
+    "linalool": ("unknown", "Компонент отдушки, возможный аллерген"),
+    "retinol": ("unknown", "Активный компонент, может раздражать; вводить постепенно"),
+    "salicylic acid": ("unknown", "BHA-кислота, полезна для пор, но может сушить"),
+}
+
+_LABEL_RE = re.compile(r"^\s*(ingredients|inci|состав|ингредиенты)\s*:\s*", re.IGNORECASE)
+# Запятая между цифрами — часть названия (1,2-Hexanediol), а не разделитель
+_SPLIT_RE = re.compile(r"(?:(?<!\d),|,(?!\d)|[;\n•·])+")
+_PERCENT_RE = re.compile(r"\d+([.,]\d+)?\s*%")
+_PARENS_RE = re.compile(r"\(([^)]*)\)")
+
+
+def normalize_ingredient(name: str) -> str:
+    """Приводит название к каноническому виду: 'Aqua (Water)*' -> 'water'."""
+    name = _PERCENT_RE.sub("", name.lower())
+    name = name.replace("*", "").replace("(and)", " ")
+    name = _PARENS_RE.sub("", name)
+    name = " ".join(name.split()).strip(" .")
+
+    for variant in [name, *name.split("/")]:
+        variant = variant.strip()
+        if variant in ALIASES:
+            return ALIASES[variant]
+        if variant in SEED_INGREDIENTS:
+            return variant
+    return name
+
+
+def tokenize_ingredients(input_text: str) -> list:
+    """Разбивает состав на ингредиенты: список пар (как написано, каноническое имя) без повторов."""
+    text = _LABEL_RE.sub("", input_text.strip())
+    seen = set()
+    tokens = []
+    for raw in _SPLIT_RE.split(text):
+        display = " ".join(_PERCENT_RE.sub("", raw).replace("*", "").split()).strip(" .")
+        if not display:
+            continue
+        canonical = normalize_ingredient(display)
+        if not canonical or canonical in seen:
+            continue
+        seen.add(canonical)
+        tokens.append((display, canonical))
+    return tokens
+
+
+class IngredientStore:
+    """
+    Индекс известных классификаций: базовый словарь плюс ответы модели,
+    сохранённые в БД. Поиск идёт по словарю в памяти.
+    """
+
+    def __init__(self):
+        self._index = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict:
+        index = {name: {"category": category, "note": note} for name, (category, note) in SEED_INGREDIENTS.items()}
+        db = SessionLocal()
+        try:
+            for row in db.query(models.Ingredient).all():
+                index[row.name] = {"category": row.category, "note": row.note}
+        finally:
+            db.close()
+        return index
+
+    @property
+    def index(self) -> dict:
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = self._load()
+        return self._index
+
+    def lookup(self, names: list):
+        """Возвращает (найденные {имя: запись}, список неизвестных имён)."""
+        index = self.index
+        known = {name: index[name] for name in names if name in index}
+        unknown = [name for name in names if name not in index]
+        return known, unknown
+
+    def save(self, entries: dict):
+        """
+        entries: {каноническое имя: {"category": ..., "note": ...}}
+        Уже записанные имена не перезаписываются: в индекс попадает версия из БД.
+        """
+        if not entries:
+            return
+        rows = [
+            {"name": name, "category": entry["category"], "note": entry["note"], "source": "llm"}
+            for name, entry in entries.items()
+        ]
+        db = SessionLocal()
+        try:
+            _insert_new(db, rows)
+            db.commit()
+            stored = {
+                row.name: {"category": row.category, "note": row.note}
+                for row in db.query(models.Ingredient).filter(models.Ingredient.name.in_(list(entries)))
+            }
+        finally:
+            db.close()
+        self.index.update({**entries, **stored})
+
+
+def _insert_new(db, rows: list):
+    """
+    Вставка с пропуском уже существующих имён. Параллельный запрос, записавший
+    тот же ингредиент, не откатывает остальные строки пачки.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        db.execute(insert(models.Ingredient).values(rows).on_conflict_do_nothing(index_elements=["name"]))
+        return
+
+    # Прочие диалекты: по строке в savepoint
+    for row in rows:
+        try:
+            with db.begin_nested():
+                db.add(models.Ingredient(**row))
+        except IntegrityError:
+            pass
+
+
+ingredient_store = IngredientStore()
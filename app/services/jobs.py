@@ -0,0 +1,120 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+
+# Сколько хранить завершённые задачи, чтобы клиент успел забрать результат
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", str(60 * 60)))
+SSE_KEEPALIVE_SECONDS = 15
+
+FINISHED_STATUSES = {"succeeded", "failed"}
+
+
+class Job:
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"
+        self.progress = 0.0
+        self.provider_status = None
+        self.task_id = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self._subscribers = set()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": self.progress,
+            "provider_status": self.provider_status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class JobManager:
+    """
+    Хранилище фоновых задач генерации в памяти процесса.
+
+    submit() сразу возвращает Job, а сама работа идёт в asyncio-задаче;
+    изменения состояния рассылаются подписчикам (SSE) через очереди.
+    """
+
+    def __init__(self):
+        self._jobs = {}
+        self._tasks = set()
+
+    def get(self, job_id: str):
+        self._cleanup()
+        return self._jobs.get(job_id)
+
+    def submit(self, kind: str, runner, *args) -> Job:
+        """runner(job, *args) — корутина, её результат становится job.result."""
+        self._cleanup()
+        job = Job(kind)
+        self._jobs[job.id] = job
+        task = asyncio.create_task(self._run(job, runner, *args))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _run(self, job: Job, runner, *args):
+        self.update(job, status="running")
+        try:
+            result = await runner(job, *args)
+        except Exception as e:
+            self.update(job, status="failed", error=str(e))
+        else:
+            self.update(job, status="succeeded", progress=1.0, result=result)
+
+    def update(self, job: Job, **fields):
+        for name, value in fields.items():
+            setattr(job, name, value)
+        job.updated_at = time.time()
+        state = job.to_dict()
+        for queue in job._subscribers:
+            queue.put_nowait(state)
+
+    async def events(self, job: Job):
+        """Отдаёт текущее состояние задачи, затем каждое изменение — до завершения."""
+        queue = asyncio.Queue()
+        job._subscribers.add(queue)
+        try:
+            state = job.to_dict()
+            yield state
+            while state["status"] not in FINISHED_STATUSES:
+                try:
+                    state = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # None — сигнал отправить keep-alive, чтобы прокси не закрыл соединение
+                    yield None
+                    continue
+                yield state
+        finally:
+            job._subscribers.discard(queue)
+
+    def _cleanup(self):
+        threshold = time.time() - JOB_RETENTION_SECONDS
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.updated_at < threshold]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+def format_sse(state) -> str:
+    if state is None:
+        return ": keep-alive\n\n"
+    return f"event: status\ndata: {json.dumps(state, ensure_ascii=False)}\n\n"
+
+
+job_manager = JobManager()
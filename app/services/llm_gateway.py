@@ -0,0 +1,315 @@
+"""
+Единая точка вызова OpenAI chat completions.
+
+Все модули ходят в модель через chat_completion(): одинаковые запросы
+отдаются из кэша, одинаковые одновременные запросы схлопываются в один
+вызов, а задержка и расход токенов учитываются по каждой модели.
+stream_chat_completion() отдаёт ответ по мере генерации и замеряет
+время до первого токена.
+"""
+import asyncio
+import contextlib
+import json
+import os
+import random
+import time
+
+from app.providers import OPENAI_TIMEOUT, get_openai_client
+from app.services import metrics
+from app.services.cache import DiskCache, TieredCache, TTLCache, sha256_hex
+
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1024"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(6 * 3600)))
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR")
+LLM_CACHE_DISK_MAX_MB = int(os.getenv("LLM_CACHE_DISK_MAX_MB", "256"))
+
+# Не больше стольких одновременных запросов к OpenAI на процесс
+OPENAI_MAX_IN_FLIGHT = int(os.getenv("OPENAI_MAX_IN_FLIGHT", "32"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "0.5"))
+OPENAI_BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", "8"))
+
+llm_cache = TieredCache(
+    TTLCache(max_entries=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL),
+    DiskCache(
+        LLM_CACHE_DIR,
+        ttl=LLM_CACHE_TTL,
+        max_bytes=LLM_CACHE_DISK_MAX_MB * 1024 * 1024,
+    ) if LLM_CACHE_DIR else None,
+)
+
+_inflight = {}
+_semaphore = None
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(OPENAI_MAX_IN_FLIGHT)
+    return _semaphore
+
+
+class ModelStats:
+    def __init__(self):
+        self.calls = 0
+        self.cache_hits = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.retries = 0
+        self.latency_seconds = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.streams = 0
+        self.ttft_seconds = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "cache_hits": self.cache_hits,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "retries": self.retries,
+            "avg_latency_ms": round(self.latency_seconds / self.calls * 1000, 1) if self.calls else 0.0,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "streams": self.streams,
+            "avg_ttft_ms": round(self.ttft_seconds / self.streams * 1000, 1) if self.streams else 0.0,
+        }
+
+
+_stats = {}
+
+
+def _model_stats(model: str) -> ModelStats:
+    stats = _stats.get(model)
+    if stats is None:
+        stats = _stats[model] = ModelStats()
+    return stats
+
+
+def gateway_stats() -> dict:
+    return {
+        "cache": llm_cache.stats(),
+        "in_flight": len(_inflight),
+        "models": {model: stats.to_dict() for model, stats in _stats.items()},
+    }
+
+
+def request_key(model: str, messages: list, temperature: float, params: dict) -> str:
+    payload = json.dumps(
+        {"model": model, "messages": messages, "temperature": temperature, "params": params},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return "chat:" + sha256_hex(payload.encode("utf-8"))
+
+
+def _is_retryable(error: Exception) -> bool:
+    import openai
+
+    return isinstance(error, (
+        asyncio.TimeoutError,
+        openai.APIConnectionError,
+        openai.RateLimitError,
+        openai.InternalServerError,
+    ))
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    # Если сервер подсказал Retry-After — слушаемся, иначе экспонента с полным джиттером
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), OPENAI_BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(OPENAI_BACKOFF_MAX, OPENAI_BACKOFF_BASE * 2 ** attempt))
+
+
+async def _create_completion(
+    model: str,
+    messages: list,
+    temperature: float,
+    params: dict,
+    timeout: float,
+    acquire_slot: bool = True,
+):
+    """
+    Вызов с общим дедлайном на все попытки и повторами при временных ошибках.
+    acquire_slot=False — слот уже занят вызывающим (поток держит его до конца ответа).
+    """
+    if temperature is not None:
+        params = {**params, "temperature": temperature}
+
+    client = get_openai_client()
+    stats = _model_stats(model)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+
+    for attempt in range(OPENAI_MAX_RETRIES + 1):
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            raise asyncio.TimeoutError(f"OpenAI call exceeded {timeout:g}s deadline")
+        try:
+            slot = metrics.slot(_get_semaphore(), "openai") if acquire_slot else contextlib.nullcontext()
+            async with slot:
+                # Для потока это время до заголовков ответа; до первого токена — отдельная гистограмма
+                with metrics.provider_call("openai", f"chat.completions/{model}"):
+                    return await asyncio.wait_for(
+                        client.chat.completions.create(model=model, messages=messages, **params),
+                        timeout=remaining,
+                    )
+        except Exception as e:
+            if attempt == OPENAI_MAX_RETRIES or not _is_retryable(e):
+                raise
+            delay = _retry_delay(e, attempt)
+            if loop.time() + delay >= deadline:
+                raise
+            stats.retries += 1
+            await asyncio.sleep(delay)
+
+
+async def _call_upstream(model: str, messages: list, temperature: float, params: dict, timeout: float) -> str:
+    stats = _model_stats(model)
+    started = time.perf_counter()
+    try:
+        response = await _create_completion(model, messages, temperature, params, timeout)
+    except Exception:
+        stats.errors += 1
+        raise
+    finally:
+        stats.calls += 1
+        stats.latency_seconds += time.perf_counter() - started
+
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        stats.prompt_tokens += usage.prompt_tokens or 0
+        stats.completion_tokens += usage.completion_tokens or 0
+    return response.choices[0].message.content
+
+
+async def chat_completion(
+    messages: list,
+    model: str = "gpt-4",
+    temperature: float = None,
+    cache: bool = True,
+    timeout: float = OPENAI_TIMEOUT,
+    **params,
+) -> str:
+    """
+    Возвращает текст ответа модели. temperature=None — значение по умолчанию API;
+    timeout — дедлайн на вызов вместе с повторами; params передаются в API как есть
+    (max_tokens, response_format) и входят в ключ кэша.
+    """
+    key = request_key(model, messages, temperature, params)
+    stats = _model_stats(model)
+
+    if cache:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            stats.cache_hits += 1
+            return cached
+
+    task = _inflight.get(key)
+    if task is not None:
+        stats.coalesced += 1
+        return await asyncio.shield(task)
+
+    # Вызов идёт в своей задаче: отмена первого запроса (клиент отключился)
+    # не отменяет ответ для остальных, ждущих тот же ключ
+    task = asyncio.ensure_future(_produce(key, model, messages, temperature, params, timeout, cache))
+    task.add_done_callback(_retrieve_exception)
+    _inflight[key] = task
+    return await asyncio.shield(task)
+
+
+async def _produce(key: str, model: str, messages: list, temperature: float, params: dict, timeout: float, cache: bool) -> str:
+    try:
+        content = await _call_upstream(model, messages, temperature, params, timeout)
+    finally:
+        _inflight.pop(key, None)
+    if cache:
+        llm_cache.set(key, content)
+    return content
+
+
+def _retrieve_exception(task: asyncio.Task):
+    # Ошибка уже передана ожидающим; помечаем её полученной, если их не осталось
+    if not task.cancelled():
+        task.exception()
+
+
+async def stream_chat_completion(
+    messages: list,
+    model: str = "gpt-4",
+    temperature: float = None,
+    cache: bool = True,
+    timeout: float = OPENAI_TIMEOUT,
+    **params,
+):
+    """
+    Асинхронный генератор фрагментов ответа. Ключ кэша тот же, что у chat_completion:
+    готовый ответ из кэша отдаётся одним фрагментом, а полностью полученный поток
+    попадает в кэш и для обычных вызовов.
+    """
+    key = request_key(model, messages, temperature, params)
+    stats = _model_stats(model)
+
+    if cache:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            stats.cache_hits += 1
+            yield cached
+            return
+
+    stream_params = {**params, "stream": True, "stream_options": {"include_usage": True}}
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    started = time.perf_counter()
+    first_token_at = None
+    parts = []
+    try:
+        # Слот занят, пока идёт поток, а не только на время create()
+        async with metrics.slot(_get_semaphore(), "openai"):
+            stream = await _create_completion(
+                model, messages, temperature, stream_params, deadline - loop.time(), acquire_slot=False
+            )
+            try:
+                chunks = aiter(stream)
+                while True:
+                    # Дедлайн общий на весь ответ; ограничиваем чтение чанков, а не время
+                    # потребителя между yield (иначе отмена по таймауту попадёт в его код)
+                    try:
+                        async with asyncio.timeout_at(deadline):
+                            chunk = await anext(chunks)
+                    except StopAsyncIteration:
+                        break
+                    usage = getattr(chunk, "usage", None)
+                    if usage is not None:
+                        stats.prompt_tokens += usage.prompt_tokens or 0
+                        stats.completion_tokens += usage.completion_tokens or 0
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if not delta:
+                        continue
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        stats.streams += 1
+                        stats.ttft_seconds += first_token_at - started
+                        metrics.llm_time_to_first_token_seconds.observe(first_token_at - started, model=model)
+                    parts.append(delta)
+                    yield delta
+            finally:
+                # Клиент мог отключиться посреди ответа — соединение отдаём сразу
+                await stream.close()
+    except Exception:
+        stats.errors += 1
+        raise
+    finally:
+        stats.calls += 1
+        stats.latency_seconds += time.perf_counter() - started
+
+    if cache and parts:
+        llm_cache.set(key, "".join(parts))
@@ -1,10 +1,6 @@
-from openai import OpenAI
-import os
 import json
 from app.schemas import MakeupSpec
-from openai.types.chat import ChatCompletionMessageParam
-
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from app.services.llm_gateway import chat_completion
 
 SYSTEM_PROMPT = """
 Ты профессиональный визажист. Получи данные о лице клиентки (форма лица, цвет кожи, подтон и т.д.).
@@ -35,7 +31,7 @@ SYSTEM_PROMPT = """
 Используй нейтральный стиль. Цвета можно писать словами или hex-кодами. Не добавляй ничего лишнего.
 """
 
-def generate_makeup_spec(face_analysis: dict) -> dict:
+async def generate_makeup_spec(face_analysis: dict, cache: bool = True) -> dict:
     useful_data = {
         "skin_tone": face_analysis.get("skin_tone"),
         "undertone": face_analysis.get("undertone"),
@@ -50,17 +46,16 @@ def generate_makeup_spec(face_analysis: dict) -> dict:
 Сгенерируй подходящий макияж в формате JSON.
 """
 
-    response = client.chat.completions.create(
+    reply = await chat_completion(
         model="gpt-4",
         messages=[
             {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": user_prompt}
         ],
-        temperature=0.7
+        temperature=0.7,
+        cache=cache,
     )
 
-    reply = response.choices[0].message.content
-
     try:
         json_start = reply.find('{')
         json_str = reply[json_start:]
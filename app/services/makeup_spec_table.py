@@ -0,0 +1,231 @@
+"""
+Локальный подбор MakeupSpec без обращения к модели.
+
+Вход — четыре категориальных признака (skin_tone × undertone × face_shape ×
+eye_distance = 162 сочетания), поэтому спецификации заранее считаются по
+правилам в таблицу. Таблицу можно обновить из LLM офлайн
+(python -m app.refresh_makeup_specs): записи из MAKEUP_SPEC_TABLE_PATH
+перекрывают правила. Режим "creative" по-прежнему ходит в gpt-4.
+"""
+import copy
+import itertools
+import json
+import os
+
+from app.schemas import MakeupSpec
+
+SKIN_TONES = ("light", "medium", "deep")
+UNDERTONES = ("warm", "cool", "neutral")
+FACE_SHAPES = ("oval", "long", "square", "heart", "diamond", "round")
+EYE_DISTANCES = ("wide", "close", "medium")
+
+# Значения для "unknown" и всего, чего нет в списках выше
+DEFAULT_FEATURES = {
+    "skin_tone": "medium",
+    "undertone": "neutral",
+    "face_shape": "oval",
+    "eye_distance": "medium",
+}
+
+SPEC_MODES = ("rules", "creative")
+MAKEUP_SPEC_MODE = os.getenv("MAKEUP_SPEC_MODE", "rules")
+MAKEUP_SPEC_TABLE_PATH = os.getenv(
+    "MAKEUP_SPEC_TABLE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "makeup_specs.json"),
+)
+
+FOUNDATION_TONE = {
+    "light": "light ivory",
+    "medium": "medium beige",
+    "deep": "deep espresso",
+}
+
+FOUNDATION_UNDERTONE = {
+    "warm": "warm golden",
+    "cool": "cool pink",
+    "neutral": "neutral",
+}
+
+FOUNDATION_COVERAGE = {
+    "light": "light",
+    "medium": "medium",
+    "deep": "medium",
+}
+
+BLUSH_COLOR = {
+    ("light", "warm"): "soft peach",
+    ("light", "cool"): "baby pink",
+    ("light", "neutral"): "dusty rose",
+    ("medium", "warm"): "apricot coral",
+    ("medium", "cool"): "rosy mauve",
+    ("medium", "neutral"): "warm rose",
+    ("deep", "warm"): "burnt orange",
+    ("deep", "cool"): "deep berry",
+    ("deep", "neutral"): "brick rose",
+}
+
+# Румяна корректируют пропорции лица
+BLUSH_PLACEMENT = {
+    "oval": "apples of the cheeks, blended toward the temples",
+    "long": "cheeks, swept horizontally toward the ears",
+    "square": "apples of the cheeks, blended in soft circles",
+    "heart": "area just below the cheekbones, blended outward",
+    "diamond": "apples of the cheeks, away from the cheekbone peaks",
+    "round": "cheekbones, swept diagonally toward the temples",
+}
+
+BLUSH_FINISH = {
+    "light": "natural",
+    "medium": "satin",
+    "deep": "luminous",
+}
+
+SHADOW_COLOR = {
+    ("light", "warm"): "champagne and soft bronze",
+    ("light", "cool"): "taupe and soft mauve",
+    ("light", "neutral"): "nude and soft brown",
+    ("medium", "warm"): "copper and warm bronze",
+    ("medium", "cool"): "plum and cool taupe",
+    ("medium", "neutral"): "warm taupe and chocolate",
+    ("deep", "warm"): "gold and rich bronze",
+    ("deep", "cool"): "deep plum and silver",
+    ("deep", "neutral"): "espresso and antique gold",
+}
+
+# Подводка визуально сближает или раздвигает глаза
+LINER_STYLE = {
+    "wide": "slim inner-corner",
+    "close": "outer-third winged",
+    "medium": "thin tightline",
+}
+
+LIP_COLOR = {
+    ("light", "warm"): "peachy nude",
+    ("light", "cool"): "rose pink",
+    ("light", "neutral"): "soft mauve-pink",
+    ("medium", "warm"): "terracotta",
+    ("medium", "cool"): "raspberry",
+    ("medium", "neutral"): "rosewood",
+    ("deep", "warm"): "brick red",
+    ("deep", "cool"): "deep berry",
+    ("deep", "neutral"): "mocha rose",
+}
+
+LIP_FINISH = {
+    "warm": "satin",
+    "cool": "cream",
+    "neutral": "satin",
+}
+
+
+def normalize_features(face_data: dict) -> tuple:
+    """(skin_tone, undertone, face_shape, eye_distance) с подстановкой значений по умолчанию."""
+    values = []
+    for name, allowed in (
+        ("skin_tone", SKIN_TONES),
+        ("undertone", UNDERTONES),
+        ("face_shape", FACE_SHAPES),
+        ("eye_distance", EYE_DISTANCES),
+    ):
+        value = face_data.get(name)
+        values.append(value if value in allowed else DEFAULT_FEATURES[name])
+    return tuple(values)
+
+
+def spec_key(features: tuple) -> str:
+    return "|".join(features)
+
+
+def build_rule_spec(skin_tone: str, undertone: str, face_shape: str, eye_distance: str) -> MakeupSpec:
+    return MakeupSpec.parse_obj({
+        "foundation": {
+            "tone": FOUNDATION_TONE[skin_tone],
+            "undertone": FOUNDATION_UNDERTONE[undertone],
+            "coverage": FOUNDATION_COVERAGE[skin_tone],
+        },
+        "blush": {
+            "color": BLUSH_COLOR[skin_tone, undertone],
+            "placement": BLUSH_PLACEMENT[face_shape],
+            "finish": BLUSH_FINISH[skin_tone],
+        },
+        "eyes": {
+            "shadow_color": SHADOW_COLOR[skin_tone, undertone],
+            "liner_style": LINER_STYLE[eye_distance],
+            "mascara": True,
+        },
+        "lips": {
+            "color": LIP_COLOR[skin_tone, undertone],
+            "finish": LIP_FINISH[undertone],
+        },
+    })
+
+
+def all_feature_combinations():
+    return itertools.product(SKIN_TONES, UNDERTONES, FACE_SHAPES, EYE_DISTANCES)
+
+
+def build_rule_table() -> dict:
+    return {spec_key(features): build_rule_spec(*features).dict() for features in all_feature_combinations()}
+
+
+def load_table_overrides(path: str) -> dict:
+    """Записи, обновлённые из LLM; невалидные пропускаются."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Makeup spec table {path} is unreadable: {e}")
+        return {}
+
+    overrides = {}
+    for key, spec in raw.items():
+        try:
+            overrides[key] = MakeupSpec.parse_obj(spec).dict()
+        except Exception as e:
+            print(f"⚠️ Skipping makeup spec {key}: {e}")
+    return overrides
+
+
+class MakeupSpecTable:
+    def __init__(self, path: str = MAKEUP_SPEC_TABLE_PATH):
+        self.path = path
+        self.reload()
+
+    def reload(self):
+        table = build_rule_table()
+        overrides = {key: spec for key, spec in load_table_overrides(self.path).items() if key in table}
+        table.update(overrides)
+        self._table = table
+        self.overrides = len(overrides)
+
+    def lookup(self, face_data: dict) -> dict:
+        return copy.deepcopy(self._table[spec_key(normalize_features(face_data))])
+
+    def __len__(self):
+        return len(self._table)
+
+
+makeup_spec_table = MakeupSpecTable()
+
+
+async def get_makeup_spec(face_data: dict, mode: str = None) -> dict:
+    """
+    mode="rules" — готовая спецификация из таблицы, без сети;
+    mode="creative" — генерация gpt-4, при ошибке разбора откатываемся на таблицу.
+    """
+    mode = mode or MAKEUP_SPEC_MODE
+    if mode not in SPEC_MODES:
+        raise ValueError(f"Unknown makeup spec mode: {mode}")
+
+    if mode == "creative":
+        from app.services.makeup_spec_ai import generate_makeup_spec
+
+        # Творческий режим должен давать разные варианты, поэтому ответ не кэшируем
+        spec = await generate_makeup_spec(face_data, cache=False)
+        if "error" not in spec:
+            return spec
+        print(f"⚠️ Creative makeup spec failed, using table: {spec.get('exception')}")
+
+    return makeup_spec_table.lookup(face_data)
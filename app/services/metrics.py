@@ -0,0 +1,401 @@
+"""
+Метрики процесса в текстовом формате Prometheus (/metrics).
+
+Гистограммы задержек по стадиям пайплайнов, шагам анализа лица и вызовам
+внешних провайдеров, счётчики ошибок и gauge'и очередей. Хук — это два
+perf_counter и пара сложений под локом, поэтому их можно ставить на
+горячем пути. Счётчики, которые уже ведут кэши и пулы, не дублируются:
+их значения снимают коллекторы в момент запроса /metrics.
+
+    with metrics.timed(metrics.face_analysis_seconds, step="decode"): ...
+    async with metrics.provider_call("runway", "text_to_image.create"): ...
+
+    @metrics.timed(metrics.executor_task_seconds, stage="db")
+    def load(): ...
+"""
+import abc
+import asyncio
+import bisect
+import contextlib
+import copy
+import functools
+import threading
+import time
+
+METRICS_PREFIX = "youglow_"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Границы бакетов в секундах: от миллисекундных шагов анализа до минут генерации Runway
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = METRICS_PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: tuple) -> dict:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self) -> list:
+        """[(суффикс имени, метки, значение)] для вывода."""
+        with self._lock:
+            return [("", self._labels(key), value) for key, value in self._values.items()]
+
+    def drain(self) -> dict:
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values: dict):
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = self._values.get(key, 0) + value
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def drain(self) -> dict:
+        # Текущее состояние не переносится между процессами
+        return {}
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        # Значение попадает в первый бакет с границей >= value; последний слот — +Inf
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self) -> list:
+        result = []
+        with self._lock:
+            items = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+        for key, (counts, total, count) in items:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                result.append(("_bucket", {**labels, "le": _format_value(float(bound))}, cumulative))
+            result.append(("_sum", labels, total))
+            result.append(("_count", labels, count))
+        return result
+
+    def merge(self, values: dict):
+        with self._lock:
+            for key, (counts, total, count) in values.items():
+                state = self._values.get(key)
+                if state is None:
+                    state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                state[0] = [a + b for a, b in zip(state[0], counts)]
+                state[1] += total
+                state[2] += count
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collector):
+        """
+        collector() вызывается на каждый запрос /metrics и возвращает список
+        (имя, тип, описание, [(метки, значение)]) — для счётчиков, которые уже где-то ведутся.
+        """
+        self._collectors.append(collector)
+
+    def drain(self) -> dict:
+        """Накопленное с прошлого вызова — для передачи из процесса-воркера в основной."""
+        drained = {}
+        for name, metric in self._metrics.items():
+            values = metric.drain()
+            if values:
+                drained[name] = values
+        return drained
+
+    def merge(self, drained: dict):
+        for name, values in drained.items():
+            metric = self._metrics.get(name)
+            if metric is not None:
+                metric.merge(values)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            samples = metric.samples()
+            if not samples:
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for suffix, labels, value in samples:
+                lines.append(f"{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+
+        for collector in self._collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                # Сломанный коллектор не должен ронять весь /metrics
+                print(f"⚠️ Metrics collector failed: {e}")
+                continue
+            for name, metric_type, documentation, samples in families:
+                name = METRICS_PREFIX + name
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+    return registry.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+    return registry.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+    return registry.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def render() -> str:
+    return registry.render()
+
+
+# ---------------- МЕТРИКИ ---------------- #
+# Все метрики объявлены здесь: процесс-воркер анализа лица регистрирует тот же набор,
+# и накопленное в нём сливается в основной процесс по имени
+
+http_request_seconds = histogram(
+    "http_request_seconds", "HTTP request latency, including streamed bodies", ("method", "route", "status"),
+)
+http_requests_in_flight = gauge("http_requests_in_flight", "HTTP requests being served")
+
+pipeline_stage_seconds = histogram(
+    "pipeline_stage_seconds", "Duration of a pipeline stage; stage=total is the whole run", ("pipeline", "stage"),
+)
+face_analysis_seconds = histogram(
+    "face_analysis_seconds", "Face analysis step duration per image", ("step",),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+face_analysis_images_total = counter("face_analysis_images_total", "Images passed through face analysis", ("result",))
+
+provider_request_seconds = histogram(
+    "provider_request_seconds", "External provider call latency", ("provider", "operation", "outcome"),
+)
+provider_requests_in_flight = gauge("provider_requests_in_flight", "External provider calls in progress", ("provider",))
+llm_time_to_first_token_seconds = histogram(
+    "llm_time_to_first_token_seconds", "Time to the first streamed token", ("model",),
+)
+
+executor_task_seconds = histogram("executor_task_seconds", "Time a task spends running in a worker pool", ("stage",))
+executor_tasks_running = gauge("executor_tasks_running", "Tasks running in worker pools", ("stage",))
+queue_depth = gauge("queue_depth", "Tasks waiting for a concurrency slot", ("queue",))
+
+errors_total = counter("errors_total", "Errors by component and exception type", ("component", "error"))
+
+
+# ---------------- ХУКИ ---------------- #
+
+class _Hook(abc.ABC):
+    """Общая часть хуков: работают как контекстный менеджер (и async) и как декоратор."""
+
+    @abc.abstractmethod
+    def _start(self):
+        """Начало замера."""
+
+    @abc.abstractmethod
+    def _finish(self, error_type):
+        """Конец замера; error_type — тип исключения или None."""
+
+    def __enter__(self):
+        self._start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._finish(exc_type)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+    def __call__(self, fn):
+        # Каждый вызов функции получает свою копию хука со своим временем старта
+        if asyncio.iscoroutinefunction(fn):
+            async def wrapper(*args, **kwargs):
+                with copy.copy(self):
+                    return await fn(*args, **kwargs)
+        else:
+            def wrapper(*args, **kwargs):
+                with copy.copy(self):
+                    return fn(*args, **kwargs)
+        return functools.wraps(fn)(wrapper)
+
+
+class Timer(_Hook):
+    def __init__(self, histogram: Histogram, **labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def _start(self):
+        self.started = time.perf_counter()
+
+    def _finish(self, error_type):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class ProviderCall(_Hook):
+    def __init__(self, provider: str, operation: str):
+        self.provider = provider
+        self.operation = operation
+
+    def _start(self):
+        provider_requests_in_flight.inc(provider=self.provider)
+        self.started = time.perf_counter()
+
+    def _finish(self, error_type):
+        seconds = time.perf_counter() - self.started
+        provider_requests_in_flight.dec(provider=self.provider)
+        if error_type is None:
+            outcome = "ok"
+        elif issubclass(error_type, asyncio.CancelledError):
+            outcome = "cancelled"
+        else:
+            outcome = "error"
+            errors_total.inc(component=self.provider, error=error_type.__name__)
+        provider_request_seconds.observe(seconds, provider=self.provider, operation=self.operation, outcome=outcome)
+
+
+@contextlib.asynccontextmanager
+async def slot(semaphore: asyncio.Semaphore, queue: str):
+    """async with semaphore, но ожидающие слота видны в queue_depth."""
+    queue_depth.inc(queue=queue)
+    try:
+        await semaphore.acquire()
+    finally:
+        queue_depth.dec(queue=queue)
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+def timed(histogram: Histogram, **labels) -> Timer:
+    """Записывает длительность блока или вызова в гистограмму."""
+    return Timer(histogram, **labels)
+
+
+def provider_call(provider: str, operation: str) -> ProviderCall:
+    """
+    Вызов внешнего провайдера: длительность с исходом ok/error/cancelled,
+    число вызовов в полёте и счётчик ошибок по типу исключения.
+    """
+    return ProviderCall(provider, operation)
+
+
+class MetricsMiddleware:
+    """
+    Время и число запросов по шаблону маршрута (/users/{user_id}, а не сам путь),
+    чтобы метки не разрастались. Для SSE время считается до конца потока.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_flight.dec()
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            http_request_seconds.observe(
+                time.perf_counter() - started, method=scope["method"], route=route, status=status["code"],
+            )
@@ -0,0 +1,131 @@
+"""
+Подготовка изображений перед отправкой провайдерам.
+
+Телефонное фото на 6–10 МБ провайдеру не нужно: Runway работает в разрешении
+кадра, vision-модель OpenAI всё равно ужимает картинку. Перед загрузкой
+уменьшаем до полезного размера, убираем EXIF и пережимаем JPEG. Результат
+кэшируется по хэшу исходника, чтобы повторы и ретраи не пережимали заново.
+"""
+import io
+import os
+import threading
+
+from app.services.cache import TTLCache, sha256_hex
+
+OUTBOUND_CACHE_SIZE = int(os.getenv("OUTBOUND_CACHE_SIZE", "64"))
+OUTBOUND_CACHE_TTL = float(os.getenv("OUTBOUND_CACHE_TTL", "3600"))
+
+# max_side — длинная сторона после уменьшения; aspect — допустимый диапазон
+# соотношения сторон (вне его изображение дополняется белыми полями)
+PROVIDER_PROFILES = {
+    "runway": {
+        "max_side": int(os.getenv("RUNWAY_UPLOAD_MAX_SIDE", "1920")),
+        "quality": int(os.getenv("RUNWAY_UPLOAD_QUALITY", "90")),
+        "aspect": (0.5, 2.0),
+    },
+    "openai_vision": {
+        "max_side": int(os.getenv("VISION_UPLOAD_MAX_SIDE", "1024")),
+        "quality": int(os.getenv("VISION_UPLOAD_QUALITY", "85")),
+        "aspect": None,
+    },
+}
+
+
+class OutboundStats:
+    def __init__(self):
+        self.prepared = 0
+        self.cache_hits = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._lock = threading.Lock()
+
+    def record(self, bytes_in: int, bytes_out: int, cached: bool):
+        with self._lock:
+            if cached:
+                self.cache_hits += 1
+            else:
+                self.prepared += 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+
+    def to_dict(self) -> dict:
+        return {
+            "prepared": self.prepared,
+            "cache_hits": self.cache_hits,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "bytes_saved": self.bytes_in - self.bytes_out,
+        }
+
+
+_cache = TTLCache(max_entries=OUTBOUND_CACHE_SIZE, ttl=OUTBOUND_CACHE_TTL)
+_stats = {provider: OutboundStats() for provider in PROVIDER_PROFILES}
+
+
+def _fits_profile(image, profile: dict) -> bool:
+    """JPEG без поворота по EXIF, в пределах размера и соотношения сторон профиля."""
+    if image.format != "JPEG" or image.getexif().get(0x0112, 1) != 1:
+        return False
+    width, height = image.size
+    if max(width, height) > profile["max_side"]:
+        return False
+    if profile["aspect"] is not None:
+        min_ratio, max_ratio = profile["aspect"]
+        return min_ratio <= width / height <= max_ratio
+    return True
+
+
+def _pad_to_aspect(image, aspect: tuple):
+    from PIL import ImageOps
+
+    min_ratio, max_ratio = aspect
+    width, height = image.size
+    ratio = width / height
+    if ratio < min_ratio:
+        return ImageOps.pad(image, (int(height * min_ratio), height), color=(255, 255, 255))
+    if ratio > max_ratio:
+        return ImageOps.pad(image, (width, int(width / max_ratio)), color=(255, 255, 255))
+    return image
+
+
+def encode_for_provider(image_bytes, provider: str) -> bytes:
+    """
+    Уменьшение, поворот по EXIF, дополнение полями и пережатие в JPEG без метаданных.
+    Если исходник уже подходит профилю, а пережатый файл не меньше — отдаём исходник.
+    """
+    from PIL import Image, ImageOps
+
+    profile = PROVIDER_PROFILES[provider]
+    max_side = profile["max_side"]
+
+    image = Image.open(io.BytesIO(image_bytes))
+    fits = _fits_profile(image, profile)
+    # JPEG сразу декодируется в уменьшенном масштабе (не меньше нужного размера)
+    image.draft("RGB", (max_side, max_side))
+    image = ImageOps.exif_transpose(image).convert("RGB")
+    if profile["aspect"] is not None:
+        image = _pad_to_aspect(image, profile["aspect"])
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    buf = io.BytesIO()
+    image.save(buf, format="JPEG", quality=profile["quality"], optimize=True)
+    if fits and buf.tell() >= len(image_bytes):
+        return bytes(image_bytes)
+    return buf.getvalue()
+
+
+def prepare_outbound(image_bytes, provider: str) -> bytes:
+    """encode_for_provider с кэшем по хэшу исходных байтов."""
+    key = f"{provider}:{sha256_hex(image_bytes)}"
+    prepared = _cache.get(key)
+    cached = prepared is not None
+    if not cached:
+        prepared = encode_for_provider(image_bytes, provider)
+        _cache.set(key, prepared)
+    _stats[provider].record(len(image_bytes), len(prepared), cached)
+    return prepared
+
+
+def outbound_stats() -> dict:
+    return {provider: stats.to_dict() for provider, stats in _stats.items()}
@@ -0,0 +1,108 @@
+"""
+Хэширование паролей вне event loop.
+
+bcrypt — это ~250 мс чистого CPU на вызов. Хэширование и проверка идут в
+отдельном пуле потоков (bcrypt отпускает GIL); очередь ограничена, и при
+переполнении запрос сразу получает отказ, а не копится. При входе хэш со
+старыми параметрами (например, после смены BCRYPT_ROUNDS) пересчитывается.
+"""
+import asyncio
+import os
+import threading
+import time
+
+from passlib.context import CryptContext
+
+from app.services.executor import PASSWORD_HASH_THREADS, get_password_hash_pool
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Сколько операций может ждать или выполняться одновременно; сверх — отказ
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", str(PASSWORD_HASH_THREADS * 8)))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+class PasswordHasherBusy(Exception):
+    """Очередь хэширования переполнена."""
+
+
+class OperationStats:
+    def __init__(self):
+        self.calls = 0
+        self.rejected = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, seconds: float):
+        self.calls += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "rejected": self.rejected,
+            "avg_ms": round(self.seconds / self.calls * 1000, 1) if self.calls else 0.0,
+            "max_ms": round(self.max_seconds * 1000, 1),
+        }
+
+
+class PasswordHasher:
+    def __init__(self, max_queue: int = PASSWORD_HASH_QUEUE):
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.rehashed = 0
+        self._stats = {"hash": OperationStats(), "verify": OperationStats()}
+        self._lock = threading.Lock()
+
+    async def _submit(self, operation: str, fn, *args):
+        stats = self._stats[operation]
+        with self._lock:
+            if self.in_flight >= self.max_queue:
+                stats.rejected += 1
+                raise PasswordHasherBusy(f"Password hashing queue is full ({self.max_queue})")
+            self.in_flight += 1
+
+        def timed():
+            # Время замеряем в потоке: ожидание в очереди не считается задержкой bcrypt
+            started = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                seconds = time.perf_counter() - started
+                with self._lock:
+                    stats.record(seconds)
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(get_password_hash_pool(), timed)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._submit("hash", pwd_context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed: str):
+        """
+        (верен ли пароль, новый хэш или None). Новый хэш возвращается, если
+        текущий посчитан с устаревшими параметрами — его нужно сохранить.
+        """
+        valid, new_hash = await self._submit("verify", pwd_context.verify_and_update, password, hashed)
+        if new_hash is not None:
+            self.rehashed += 1
+        return valid, new_hash
+
+    async def dummy_verify(self):
+        # Для несуществующего пользователя тратим столько же времени, сколько на проверку
+        await self._submit("verify", pwd_context.dummy_verify)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_queue": self.max_queue,
+            "rehashed": self.rehashed,
+            **{operation: stats.to_dict() for operation, stats in self._stats.items()},
+        }
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,140 @@
+"""
+Небольшой исполнитель DAG из асинхронных стадий.
+
+Стадия объявляет имя, корутину и зависимости — имена других стадий или
+входов; их результаты передаются в корутину позиционно в порядке deps.
+Стадия стартует, как только готовы её зависимости, поэтому независимые
+стадии идут параллельно. Результаты передаются дальше по
+ссылке, без копирования. Для каждой стадии замеряется время, а stream()
+отдаёт результаты по мере готовности, чтобы клиент получал их частями.
+"""
+import asyncio
+import os
+import time
+
+from app.services import metrics
+
+# Время стадий всегда уходит в метрики; печатать его на каждый запуск — только для отладки
+PIPELINE_LOG_TIMINGS = os.getenv("PIPELINE_LOG_TIMINGS", "0") == "1"
+
+
+class Stage:
+    def __init__(self, name: str, fn, deps: tuple = ()):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+
+
+class PipelineError(Exception):
+    def __init__(self, stage: str, error: Exception):
+        super().__init__(f"Stage '{stage}' failed: {error}")
+        self.stage = stage
+        self.error = error
+
+
+class StageSkipped(Exception):
+    """Стадия не запускалась: упала одна из её зависимостей."""
+
+    def __init__(self, stage: str, dep: str):
+        super().__init__(f"Stage '{stage}' skipped: '{dep}' failed")
+        self.stage = stage
+        self.dep = dep
+
+
+class PipelineRun:
+    def __init__(self):
+        self.results = {}
+        self.timings = {}
+        self.skipped = set()
+
+    def timings_ms(self) -> dict:
+        return {name: round(seconds * 1000, 1) for name, seconds in self.timings.items()}
+
+
+class Pipeline:
+    def __init__(self, name: str, stages: list):
+        self.name = name
+        self.stages = stages
+        names = set()
+        for stage in stages:
+            if stage.name in names:
+                raise ValueError(f"Duplicate stage '{stage.name}' in pipeline '{name}'")
+            names.add(stage.name)
+        self.stage_names = names
+
+    async def stream(self, inputs: dict, run: PipelineRun = None):
+        """
+        Асинхронный генератор пар (имя стадии, результат) в порядке завершения.
+        При ошибке стадии остальные отменяются и поднимается PipelineError.
+        """
+        run = run if run is not None else PipelineRun()
+        run.results.update(inputs)
+        started = time.perf_counter()
+
+        for stage in self.stages:
+            missing = [dep for dep in stage.deps if dep not in self.stage_names and dep not in inputs]
+            if missing:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown {missing}")
+
+        futures = {}
+
+        async def run_stage(stage: Stage):
+            for dep in stage.deps:
+                if dep in futures:
+                    try:
+                        await futures[dep]
+                    except Exception:
+                        # Ошибку уже учла и поднимет упавшая стадия, эту просто не запускаем
+                        run.skipped.add(stage.name)
+                        raise StageSkipped(stage.name, dep) from None
+            stage_started = time.perf_counter()
+            try:
+                result = await stage.fn(*(run.results[dep] for dep in stage.deps))
+            except Exception as e:
+                metrics.errors_total.inc(component=f"{self.name}.{stage.name}", error=type(e).__name__)
+                raise
+            finally:
+                run.timings[stage.name] = time.perf_counter() - stage_started
+            metrics.pipeline_stage_seconds.observe(run.timings[stage.name], pipeline=self.name, stage=stage.name)
+            run.results[stage.name] = result
+            return result
+
+        tasks = {}
+        order = {}
+        for index, stage in enumerate(self.stages):
+            task = asyncio.ensure_future(run_stage(stage))
+            futures[stage.name] = task
+            tasks[task] = stage.name
+            order[task] = index
+
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # Завершившиеся одновременно стадии отдаём в порядке объявления
+                for task in sorted(done, key=order.get):
+                    name = tasks[task]
+                    error = task.exception()
+                    if isinstance(error, StageSkipped):
+                        continue
+                    if error is not None:
+                        # Помечаем полученными ошибки остальных завершившихся стадий
+                        for other in done:
+                            other.exception()
+                        raise PipelineError(name, error) from error
+                    yield name, task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            run.timings["total"] = time.perf_counter() - started
+            metrics.pipeline_stage_seconds.observe(run.timings["total"], pipeline=self.name, stage="total")
+            if PIPELINE_LOG_TIMINGS:
+                print(f"🧩 Pipeline {self.name}: " + ", ".join(f"{k}={v}ms" for k, v in run.timings_ms().items()))
+
+    async def run(self, inputs: dict) -> PipelineRun:
+        run = PipelineRun()
+        async for _ in self.stream(inputs, run):
+            pass
+        return run
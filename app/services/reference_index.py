@@ -0,0 +1,187 @@
+"""
+Индекс описаний референсов макияжа по перцептивным хэшам.
+
+Популярные образы присылают снова и снова — с другим кропом или сжатием.
+Для каждого описанного референса храним pHash и dHash (по 64 бита);
+если новый референс близок по расстоянию Хэмминга к уже описанному,
+переиспользуем описание GPT-4o без vision-запроса.
+"""
+import io
+import os
+import threading
+
+import numpy as np
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import models
+from app.database import SessionLocal
+from app.services.executor import run_blocking, run_cpu_bound
+
+# Совпадение — когда оба хэша не дальше порогов (в битах из 64)
+REFERENCE_PHASH_DISTANCE = int(os.getenv("REFERENCE_PHASH_DISTANCE", "10"))
+REFERENCE_DHASH_DISTANCE = int(os.getenv("REFERENCE_DHASH_DISTANCE", "12"))
+
+PHASH_SIZE = 32
+PHASH_LOW_FREQ = 8
+
+# Матрица DCT-II для pHash: строится при первом хэшировании
+_dct = None
+
+# Число единичных бит для каждого байта
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _dct_matrix() -> np.ndarray:
+    global _dct
+    if _dct is None:
+        k = np.arange(PHASH_SIZE)
+        matrix = np.sqrt(2.0 / PHASH_SIZE) * np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * PHASH_SIZE))
+        matrix[0] /= np.sqrt(2.0)
+        _dct = matrix
+    return _dct
+
+
+def _grayscale(image_bytes, size: tuple) -> np.ndarray:
+    from PIL import Image, ImageOps
+
+    image = Image.open(io.BytesIO(image_bytes))
+    # JPEG декодируется сразу в уменьшенном масштабе
+    image.draft("L", (size[0] * 4, size[1] * 4))
+    image = ImageOps.exif_transpose(image).convert("L").resize(size, Image.LANCZOS)
+    return np.asarray(image, dtype=np.float32)
+
+
+def _pack(bits: np.ndarray) -> bytes:
+    return np.packbits(bits.ravel()).tobytes()
+
+
+def perceptual_hashes(image_bytes) -> tuple:
+    """(phash, dhash) — по 8 байт каждый."""
+    pixels = _grayscale(image_bytes, (PHASH_SIZE, PHASH_SIZE))
+    dct = _dct_matrix()
+    coefficients = (dct @ pixels @ dct.T)[:PHASH_LOW_FREQ, :PHASH_LOW_FREQ]
+    # Постоянная составляющая не участвует в медиане: она зависит только от яркости
+    median = np.median(coefficients.ravel()[1:])
+    phash = _pack(coefficients > median)
+
+    pixels = _grayscale(image_bytes, (9, 8))
+    dhash = _pack(pixels[:, 1:] > pixels[:, :-1])
+    return phash, dhash
+
+
+def hamming_distances(hashes: np.ndarray, query: bytes) -> np.ndarray:
+    """hashes — массив (N, 8) uint8; возвращает расстояния до query для всех строк."""
+    xor = np.bitwise_xor(hashes, np.frombuffer(query, dtype=np.uint8))
+    return _POPCOUNT[xor].sum(axis=1, dtype=np.int32)
+
+
+class ReferenceIndex:
+    """
+    Хэши всех описанных референсов в памяти (массивы NumPy), описания — в БД.
+    Поиск — полный перебор по расстоянию Хэмминга: десятки тысяч записей
+    проверяются за единицы миллисекунд.
+    """
+
+    def __init__(self):
+        # (phashes, dhashes, descriptions) заменяется целиком, поэтому find без блокировки
+        # всегда видит согласованную версию
+        self._snapshot = (np.empty((0, 8), dtype=np.uint8), np.empty((0, 8), dtype=np.uint8), [])
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self):
+        db = SessionLocal()
+        try:
+            rows = db.query(models.MakeupReference).order_by(models.MakeupReference.id).all()
+        finally:
+            db.close()
+        if rows:
+            self._snapshot = (
+                np.array([list(bytes.fromhex(row.phash)) for row in rows], dtype=np.uint8),
+                np.array([list(bytes.fromhex(row.dhash)) for row in rows], dtype=np.uint8),
+                [row.description for row in rows],
+            )
+        self._loaded = True
+        print(f"🖼️ Reference index loaded: {len(rows)} entries")
+
+    def ensure_loaded(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._load()
+
+    def find(self, phash: bytes, dhash: bytes):
+        """Описание ближайшего подходящего референса или None."""
+        self.ensure_loaded()
+        phashes, dhashes, descriptions = self._snapshot
+        if not descriptions:
+            self.misses += 1
+            return None
+
+        p_dist = hamming_distances(phashes, phash)
+        d_dist = hamming_distances(dhashes, dhash)
+        candidates = np.flatnonzero((p_dist <= REFERENCE_PHASH_DISTANCE) & (d_dist <= REFERENCE_DHASH_DISTANCE))
+        if candidates.size == 0:
+            self.misses += 1
+            return None
+
+        best = candidates[np.argmin(p_dist[candidates] + d_dist[candidates])]
+        self.hits += 1
+        return descriptions[best]
+
+    def add(self, phash: bytes, dhash: bytes, description: str):
+        self.ensure_loaded()
+        db = SessionLocal()
+        try:
+            db.add(models.MakeupReference(phash=phash.hex(), dhash=dhash.hex(), description=description))
+            db.commit()
+        except SQLAlchemyError as e:
+            db.rollback()
+            print(f"⚠️ Failed to persist reference description: {e}")
+        finally:
+            db.close()
+
+        with self._lock:
+            phashes, dhashes, descriptions = self._snapshot
+            self._snapshot = (
+                np.vstack([phashes, np.frombuffer(phash, dtype=np.uint8)]),
+                np.vstack([dhashes, np.frombuffer(dhash, dtype=np.uint8)]),
+                descriptions + [description],
+            )
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "entries": len(self._snapshot[2]),
+        }
+
+
+reference_index = ReferenceIndex()
+
+
+async def describe_reference_cached(image_bytes) -> str:
+    """
+    describe_makeup_from_image с поиском по индексу: близкий к уже описанному
+    референс (другой кроп, пересжатие) получает сохранённое описание.
+    """
+    from app.describe_makeup import describe_makeup_from_image
+
+    try:
+        phash, dhash = await run_cpu_bound("image_hash", perceptual_hashes, image_bytes)
+    except Exception as e:
+        print(f"⚠️ Reference hashing failed: {e}")
+        return await describe_makeup_from_image(image_bytes)
+
+    description = await run_blocking("db", reference_index.find, phash, dhash)
+    if description is not None:
+        return description
+
+    description = await describe_makeup_from_image(image_bytes)
+    if description:
+        await run_blocking("db", reference_index.add, phash, dhash, description)
+    return description
@@ -0,0 +1,114 @@
+import asyncio
+import os
+import time
+
+from app.providers import get_async_runway_client
+from app.services import metrics
+
+RUNWAY_POLL_INTERVAL = float(os.getenv("RUNWAY_POLL_INTERVAL", "2"))
+RUNWAY_TASK_TIMEOUT = float(os.getenv("RUNWAY_TASK_TIMEOUT", str(10 * 60)))
+
+TERMINAL_STATUSES = {"SUCCEEDED", "FAILED", "CANCELLED"}
+
+
+class RunwayTaskError(Exception):
+    def __init__(self, task_id: str, message: str, details=None):
+        super().__init__(f"Runway task {task_id}: {message}")
+        self.task_id = task_id
+        self.details = details
+
+
+class _Watch:
+    def __init__(self, future, on_progress, deadline):
+        self.future = future
+        self.on_progress = on_progress
+        self.deadline = deadline
+
+
+class RunwayTaskPoller:
+    """
+    Общий опрашивающий цикл для всех задач Runway процесса.
+
+    Вместо того чтобы каждый запрос держал поток в wait_for_task_output(),
+    задачи регистрируются здесь, а один фоновый цикл раз в interval секунд
+    запрашивает статусы всех ожидаемых задач сразу.
+    """
+
+    def __init__(self, interval: float = RUNWAY_POLL_INTERVAL):
+        self.interval = interval
+        self._watched = {}
+        self._loop_task = None
+
+    def pending(self) -> int:
+        return len(self._watched)
+
+    async def wait(self, task_id: str, on_progress=None, timeout: float = RUNWAY_TASK_TIMEOUT) -> list:
+        """Ждёт завершения задачи и возвращает её output (список URL)."""
+        future = asyncio.get_running_loop().create_future()
+        self._watched[task_id] = _Watch(future, on_progress, time.monotonic() + timeout)
+        self._ensure_running()
+        try:
+            # Свой дедлайн на случай, если опрашивающий цикл не ответит вовсе
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise RunwayTaskError(task_id, "timed out") from None
+        finally:
+            self._watched.pop(task_id, None)
+
+    def _ensure_running(self):
+        if self._loop_task is None or self._loop_task.done():
+            self._loop_task = asyncio.create_task(self._run())
+
+    async def _retrieve(self, client, task_id: str):
+        async with metrics.provider_call("runway", "tasks.retrieve"):
+            return await client.tasks.retrieve(task_id)
+
+    async def _run(self):
+        try:
+            client = get_async_runway_client()
+            while self._watched:
+                await asyncio.sleep(self.interval)
+                watched = list(self._watched.items())
+                responses = await asyncio.gather(
+                    *(self._retrieve(client, task_id) for task_id, _ in watched),
+                    return_exceptions=True,
+                )
+                for (task_id, watch), response in zip(watched, responses):
+                    try:
+                        self._handle(task_id, watch, response)
+                    except Exception as e:
+                        # Ошибка одной задачи (например, в on_progress) не останавливает опрос остальных
+                        print(f"⚠️ Runway task {task_id} status handling failed: {e}")
+        except Exception as e:
+            # Цикл упал — никто не дождётся ответа, поэтому завершаем все ожидания ошибкой
+            print(f"❌ Runway poller stopped: {e}")
+            for task_id, watch in list(self._watched.items()):
+                if not watch.future.done():
+                    watch.future.set_exception(RunwayTaskError(task_id, f"polling stopped: {e}"))
+
+    def _handle(self, task_id: str, watch: _Watch, response):
+        if watch.future.done():
+            return
+
+        if isinstance(response, Exception):
+            # Сетевые ошибки опроса не фатальны — попробуем на следующем круге
+            if time.monotonic() > watch.deadline:
+                watch.future.set_exception(RunwayTaskError(task_id, f"polling failed: {response}"))
+            return
+
+        if response.status == "SUCCEEDED":
+            if response.output:
+                watch.future.set_result(response.output)
+            else:
+                watch.future.set_exception(RunwayTaskError(task_id, "task succeeded without output", response))
+        elif response.status in TERMINAL_STATUSES:
+            watch.future.set_exception(
+                RunwayTaskError(task_id, response.failure or response.status.lower(), response)
+            )
+        elif time.monotonic() > watch.deadline:
+            watch.future.set_exception(RunwayTaskError(task_id, "timed out", response))
+        elif watch.on_progress is not None:
+            watch.on_progress(response.status, response.progress)
+
+
+runway_poller = RunwayTaskPoller()
@@ -0,0 +1,67 @@
+import asyncio
+import os
+
+from fastapi import HTTPException, UploadFile
+from starlette.responses import JSONResponse
+
+MAX_UPLOAD_MB = float(os.getenv("MAX_UPLOAD_MB", "15"))
+MAX_UPLOAD_BYTES = int(MAX_UPLOAD_MB * 1024 * 1024)
+# Запрос целиком может нести несколько файлов (/try-on) плюс служебные части multipart
+MAX_REQUEST_BYTES = int(os.getenv("MAX_REQUEST_BYTES", str(MAX_UPLOAD_BYTES * 2 + 1024 * 1024)))
+CHUNK_SIZE = 1024 * 1024
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Отклоняет слишком большие multipart-запросы по Content-Length ещё до того,
+    как Starlette начнёт разбирать тело и складывать его во временные файлы.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_REQUEST_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            headers = dict(scope["headers"])
+            content_length = headers.get(b"content-length")
+            if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+                response = JSONResponse(status_code=413, content={"detail": "Request body too large"})
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+async def read_upload(upload: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> memoryview:
+    """
+    Читает загруженный файл один раз в ограниченный буфер и возвращает memoryview,
+    который дальше без копий передаётся в анализ и вызовы провайдеров.
+    """
+    if upload.size is not None and upload.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"File is larger than {MAX_UPLOAD_MB:g} MB")
+
+    buffer = bytearray()
+    while True:
+        chunk = await upload.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        if len(buffer) + len(chunk) > max_bytes:
+            raise HTTPException(status_code=413, detail=f"File is larger than {MAX_UPLOAD_MB:g} MB")
+        buffer += chunk
+
+    if not buffer:
+        raise HTTPException(status_code=400, detail="Empty file")
+    return memoryview(buffer)
+
+
+def _write_file(path: str, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+async def persist_upload(data, directory: str, filename: str) -> str:
+    """Сохраняет файл на диск — только когда сохранение действительно запрошено."""
+    path = os.path.join(directory, filename)
+    await asyncio.to_thread(_write_file, path, data)
+    return path
@@ -0,0 +1,90 @@
+"""
+Кэш аутентифицированных пользователей.
+
+get_current_user на каждый запрос декодировал JWT и ходил в БД за
+пользователем. Теперь разобранный токен кэшируется до его истечения,
+а пользователь — по subject (username) на USER_CACHE_TTL, но не дольше
+жизни токена. Изменение профиля и регистрация сбрасывают запись явно.
+"""
+import os
+import time
+
+from app.services.cache import TTLCache, sha256_hex
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+# Верхняя граница устаревания, если пользователя поменяли в обход API
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+
+_tokens = TTLCache(max_entries=USER_CACHE_SIZE)
+_users = TTLCache(max_entries=USER_CACHE_SIZE)
+
+
+class UserCacheStats:
+    def __init__(self):
+        self.token_hits = 0
+        self.token_misses = 0
+        self.user_hits = 0
+        self.user_misses = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "token_hits": self.token_hits,
+            "token_misses": self.token_misses,
+            "user_hits": self.user_hits,
+            "user_misses": self.user_misses,
+            "users": len(_users),
+        }
+
+
+stats = UserCacheStats()
+
+
+def _ttl_until(expires_at) -> float:
+    if expires_at is None:
+        return USER_CACHE_TTL
+    return float(expires_at) - time.time()
+
+
+def _token_key(token: str) -> str:
+    # Сами токены в памяти не держим
+    return sha256_hex(token.encode("utf-8"))
+
+
+def get_token_payload(token: str):
+    payload = _tokens.get(_token_key(token))
+    if payload is None:
+        stats.token_misses += 1
+    else:
+        stats.token_hits += 1
+    return payload
+
+
+def remember_token_payload(token: str, payload: dict):
+    ttl = _ttl_until(payload.get("exp"))
+    if ttl > 0:
+        _tokens.set(_token_key(token), payload, ttl=ttl)
+
+
+def get_user(username: str):
+    user = _users.get(username)
+    if user is None:
+        stats.user_misses += 1
+    else:
+        stats.user_hits += 1
+    return user
+
+
+def remember_user(username: str, user, expires_at=None):
+    ttl = min(USER_CACHE_TTL, _ttl_until(expires_at))
+    if ttl > 0:
+        _users.set(username, user, ttl=ttl)
+
+
+def invalidate_user(*usernames: str):
+    for username in usernames:
+        if username:
+            _users.delete(username)
+
+
+def user_cache_stats() -> dict:
+    return stats.to_dict()
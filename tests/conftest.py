@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# База для тестов — временный файл SQLite; задаётся до импорта app.database
+_db_dir = tempfile.mkdtemp(prefix="youglow-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_db_dir, 'test.db')}")
+os.environ.setdefault("SECRET_KEY", "test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
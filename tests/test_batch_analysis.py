@@ -0,0 +1,49 @@
+import pytest
+
+from app.batch_analysis import write_parquet
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+FACE = {
+    "average_rgb": [200, 170, 150],
+    "skin_tone": "light",
+    "undertone": "warm",
+    "eye_distance": "average",
+    "face_shape": "oval",
+    "eye_shape": "almond",
+    "lip_shape": "full",
+    "brow_shape": "arched",
+    "cheek_undertone": "warm",
+    "skin_type": "normal",
+}
+
+
+def test_mixed_batch_keeps_feature_columns(tmp_path):
+    output = tmp_path / "faces.parquet"
+    rows = [
+        {"path": "broken.jpg", "error": "Could not load image"},
+        {"path": "face.jpg", **FACE},
+    ]
+
+    assert write_parquet(iter(rows), str(output)) == 2
+
+    table = pq.read_table(output)
+    assert "landmarks" not in table.column_names
+    written = table.to_pylist()
+    assert written[0]["error"] == "Could not load image"
+    assert written[0]["face_shape"] is None
+    assert written[1] == {"path": "face.jpg", "error": None, **FACE}
+
+
+def test_landmarks_column_when_present(tmp_path):
+    output = tmp_path / "faces.parquet"
+    rows = [
+        {"path": "none.jpg", "error": "No face detected"},
+        {"path": "face.jpg", **FACE, "landmarks": [[0.5, 0.25, 0.0]]},
+    ]
+
+    write_parquet(rows, str(output))
+
+    written = pq.read_table(output).to_pylist()
+    assert written[0]["landmarks"] is None
+    assert written[1]["landmarks"] == [[0.5, 0.25, 0.0]]
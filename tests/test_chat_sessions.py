@@ -0,0 +1,72 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.services.chat_sessions import (
+    SESSION_COOKIE_KEY,
+    ChatSessionForbidden,
+    ChatSessionStore,
+    chat_sessions,
+    reset_session,
+    resolve_session,
+)
+
+
+def fake_request():
+    return SimpleNamespace(session={})
+
+
+def test_unknown_id_gets_a_fresh_server_id():
+    store = ChatSessionStore()
+
+    session = store.get_or_create("chosen-by-client", "anon:a")
+
+    assert session.id != "chosen-by-client"
+    assert store.get_or_create(session.id, "anon:a") is session
+
+
+def test_foreign_id_is_refused():
+    store = ChatSessionStore()
+    session = store.get_or_create(None, "user:1")
+
+    with pytest.raises(ChatSessionForbidden):
+        store.get_or_create(session.id, "user:2")
+    with pytest.raises(ChatSessionForbidden):
+        store.reset(session.id, "user:2")
+    assert store.reset(session.id, "user:1")
+
+
+def test_resolve_session_binds_to_cookie_owner():
+    owner_request = fake_request()
+    session = resolve_session(owner_request)
+    assert owner_request.session[SESSION_COOKIE_KEY] == session.id
+    assert resolve_session(owner_request, session.id) is session
+
+    with pytest.raises(HTTPException) as error:
+        resolve_session(fake_request(), session.id)
+    assert error.value.status_code == 403
+
+    chat_sessions.reset(session.id, session.owner)
+
+
+def test_resolve_session_binds_to_user():
+    user = SimpleNamespace(id=7)
+    session = resolve_session(fake_request(), user=user)
+
+    # Тот же пользователь с другого устройства получает свою сессию
+    assert resolve_session(fake_request(), session.id, user) is session
+    with pytest.raises(HTTPException):
+        reset_session(fake_request(), session.id, SimpleNamespace(id=8))
+    assert reset_session(fake_request(), session.id, user)
+
+
+def test_foreign_cookie_session_is_replaced():
+    anonymous = fake_request()
+    anonymous_session = resolve_session(anonymous)
+
+    # После входа в cookie осталась анонимная сессия: начинается новая
+    session = resolve_session(anonymous, user=SimpleNamespace(id=9))
+
+    assert session is not anonymous_session
+    assert anonymous.session[SESSION_COOKIE_KEY] == session.id
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from app.services.cache import TieredCache, TTLCache
+from app.services.generation_cache import GENERATION_CACHE_DIR, GenerationCache
+
+
+def make_cache() -> GenerationCache:
+    return GenerationCache(TieredCache(TTLCache(max_entries=16, ttl=60)))
+
+
+def test_disk_tier_is_off_by_default():
+    assert not GENERATION_CACHE_DIR
+
+
+def test_cancelled_leader_does_not_cancel_waiters():
+    async def scenario():
+        cache = make_cache()
+        calls = []
+
+        async def producer():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "url"
+
+        leader = asyncio.ensure_future(cache.get_or_generate("k1", producer))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.ensure_future(cache.get_or_generate("k1", producer))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+
+        assert await waiter == "url"
+        assert leader.cancelled()
+        assert len(calls) == 1
+        assert cache.get("k1") == "url"
+
+    asyncio.run(scenario())
+
+
+def test_generation_error_reaches_every_waiter():
+    async def scenario():
+        cache = make_cache()
+
+        async def producer():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("runway down")
+
+        results = await asyncio.gather(
+            cache.get_or_generate("k1", producer),
+            cache.get_or_generate("k1", producer),
+            return_exceptions=True,
+        )
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert cache.stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_empty_result_is_not_cached():
+    async def scenario():
+        cache = make_cache()
+
+        async def producer():
+            return None
+
+        assert await cache.get_or_generate("k1", producer) is None
+        assert cache.get("k1") is None
+
+    asyncio.run(scenario())
+
+
+def test_hit_skips_producer():
+    async def scenario():
+        cache = make_cache()
+        hits = []
+
+        async def producer():
+            return "url"
+
+        await cache.get_or_generate("k1", producer)
+
+        async def failing():
+            pytest.fail("producer must not run on a cache hit")
+
+        assert await cache.get_or_generate("k1", failing, on_hit=hits.append) == "url"
+        assert hits == ["url"]
+
+    asyncio.run(scenario())
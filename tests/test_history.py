@@ -0,0 +1,56 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import models
+from app.database import AsyncSessionLocal, dispose_engines, engine
+from app.migrations import migrate
+from app.services.history import decode_cursor, encode_cursor, list_looks
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2026, 10, 18, 7, 49, 56, 417074)
+    assert decode_cursor(encode_cursor(created_at, 42)) == (created_at, 42)
+
+
+@pytest.mark.parametrize("cursor", ["zzz", "", "bm90IGpzb24", encode_cursor(datetime(2026, 1, 1), 1)[:-3]])
+def test_bad_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_keyset_pagination_walks_every_look_once():
+    migrate(engine)
+    base = datetime(2026, 10, 18, 12, 0, 0)
+    # Половина записей с одинаковым created_at — порядок между ними держит id
+    created = [base + timedelta(seconds=i // 2) for i in range(7)]
+
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            user = models.User(username="history-user", hashed_password="x")
+            db.add(user)
+            await db.flush()
+            db.add_all([
+                models.LookRecord(user_id=user.id, image_hash="h", kind="generate_look", created_at=at)
+                for at in created
+            ])
+            await db.commit()
+            user_id = user.id
+
+        seen, cursor, pages = [], None, 0
+        while True:
+            page = await list_looks(user_id, limit=3, cursor=cursor)
+            seen += [(item["created_at"], item["id"]) for item in page["items"]]
+            pages += 1
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+        await dispose_engines()
+        return seen, pages
+
+    seen, pages = asyncio.run(scenario())
+    assert pages == 3
+    assert len(seen) == len(created) == len(set(seen))
+    assert seen == sorted(seen, reverse=True)
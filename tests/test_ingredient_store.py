@@ -0,0 +1,35 @@
+from app import models
+from app.database import SessionLocal, engine
+from app.migrations import migrate
+from app.services.ingredient_store import IngredientStore, tokenize_ingredients
+
+
+def test_comma_between_digits_is_part_of_the_name():
+    tokens = tokenize_ingredients("Ingredients: Aqua, 1,2-Hexanediol,Glycerin 5%; Niacinamide\n•Parfum")
+    assert [display for display, _ in tokens] == ["Aqua", "1,2-Hexanediol", "Glycerin", "Niacinamide", "Parfum"]
+
+
+def test_duplicates_are_dropped_by_canonical_name():
+    tokens = tokenize_ingredients("Aqua (Water), Water, 1,2-Hexanediol, 1,2-hexanediol")
+    assert [canonical for _, canonical in tokens] == ["water", "1,2-hexanediol"]
+
+
+def test_save_skips_existing_names_without_dropping_the_batch():
+    migrate(engine)
+    db = SessionLocal()
+    db.add(models.Ingredient(name="test-existing", category="safe", note="from db", source="seed"))
+    db.commit()
+    db.close()
+
+    store = IngredientStore()
+    store.save({
+        "test-existing": {"category": "comedogenic", "note": "from llm"},
+        "test-new": {"category": "comedogenic", "note": "from llm"},
+    })
+
+    db = SessionLocal()
+    rows = {row.name: row.category for row in db.query(models.Ingredient).filter(models.Ingredient.name.like("test-%"))}
+    db.close()
+    assert rows == {"test-existing": "safe", "test-new": "comedogenic"}
+    assert store.index["test-existing"] == {"category": "safe", "note": "from db"}
+    assert store.index["test-new"] == {"category": "comedogenic", "note": "from llm"}
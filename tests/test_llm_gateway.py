@@ -0,0 +1,114 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import llm_gateway
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+def test_cancelled_caller_does_not_cancel_coalesced_call(monkeypatch):
+    calls = []
+
+    async def fake_upstream(model, messages, temperature, params, timeout):
+        calls.append(model)
+        await asyncio.sleep(0.05)
+        return "reply"
+
+    monkeypatch.setattr(llm_gateway, "_call_upstream", fake_upstream)
+
+    async def scenario():
+        first = asyncio.ensure_future(llm_gateway.chat_completion(MESSAGES, "gpt-4", cache=False))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(llm_gateway.chat_completion(MESSAGES, "gpt-4", cache=False))
+        await asyncio.sleep(0.01)
+        first.cancel()
+
+        assert await second == "reply"
+        assert first.cancelled()
+        assert calls == ["gpt-4"]
+        assert not llm_gateway._inflight
+
+    asyncio.run(scenario())
+
+
+def test_upstream_error_is_shared(monkeypatch):
+    async def fake_upstream(model, messages, temperature, params, timeout):
+        await asyncio.sleep(0.01)
+        raise RuntimeError("openai down")
+
+    monkeypatch.setattr(llm_gateway, "_call_upstream", fake_upstream)
+
+    async def scenario():
+        results = await asyncio.gather(
+            llm_gateway.chat_completion(MESSAGES, "gpt-3.5-turbo", cache=False),
+            llm_gateway.chat_completion(MESSAGES, "gpt-3.5-turbo", cache=False),
+            return_exceptions=True,
+        )
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+    asyncio.run(scenario())
+
+
+class FakeStream:
+    def __init__(self, deltas, delay):
+        self.deltas = deltas
+        self.delay = delay
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await asyncio.sleep(self.delay)
+        if not self.deltas:
+            raise StopAsyncIteration
+        delta = SimpleNamespace(content=self.deltas.pop(0))
+        return SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=delta)])
+
+    async def close(self):
+        self.closed = True
+
+
+def fake_client(stream):
+    async def create(**kwargs):
+        return stream
+
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def test_stream_holds_slot_until_finished(monkeypatch):
+    stream = FakeStream(["a", "b"], delay=0.01)
+    monkeypatch.setattr(llm_gateway, "get_openai_client", lambda: fake_client(stream))
+
+    async def scenario():
+        semaphore = asyncio.Semaphore(1)
+        monkeypatch.setattr(llm_gateway, "_semaphore", semaphore)
+        deltas = []
+        async for delta in llm_gateway.stream_chat_completion(MESSAGES, "gpt-4", cache=False):
+            assert semaphore.locked()
+            deltas.append(delta)
+        assert deltas == ["a", "b"]
+        assert not semaphore.locked()
+        assert stream.closed
+
+    asyncio.run(scenario())
+
+
+def test_stream_deadline_covers_whole_response(monkeypatch):
+    stream = FakeStream(["a"] * 100, delay=0.02)
+    monkeypatch.setattr(llm_gateway, "get_openai_client", lambda: fake_client(stream))
+
+    async def scenario():
+        semaphore = asyncio.Semaphore(1)
+        monkeypatch.setattr(llm_gateway, "_semaphore", semaphore)
+        deltas = []
+        with pytest.raises(asyncio.TimeoutError):
+            async for delta in llm_gateway.stream_chat_completion(MESSAGES, "gpt-4", cache=False, timeout=0.1):
+                deltas.append(delta)
+        assert 0 < len(deltas) < 10
+        assert not semaphore.locked()
+        assert stream.closed
+
+    asyncio.run(scenario())
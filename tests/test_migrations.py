@@ -0,0 +1,57 @@
+import threading
+
+from sqlalchemy import inspect
+
+from app import models
+from app.database import build_engine
+from app.migrations import MIGRATIONS, current_version, migrate
+
+LATEST = MIGRATIONS[-1][0]
+
+
+def test_migrate_is_idempotent(tmp_path):
+    engine = build_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    assert migrate(engine) == LATEST
+    assert migrate(engine) == LATEST
+    assert {"users", "looks", "face_profiles"} <= set(inspect(engine).get_table_names())
+    engine.dispose()
+
+
+def test_adopts_database_created_by_create_all(tmp_path):
+    engine = build_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    models.Base.metadata.create_all(bind=engine)
+    assert migrate(engine) == LATEST
+    engine.dispose()
+
+
+def test_concurrent_workers_apply_each_migration_once(tmp_path):
+    url = f"sqlite:///{tmp_path / 'app.db'}"
+    workers = 6
+    barrier = threading.Barrier(workers)
+    results, errors = [], []
+
+    def worker():
+        engine = build_engine(url)
+        barrier.wait()
+        try:
+            results.append(migrate(engine))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            engine.dispose()
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert results == [LATEST] * workers
+
+    engine = build_engine(url)
+    with engine.connect() as conn:
+        assert current_version(conn) == LATEST
+        versions = [row[0] for row in conn.exec_driver_sql("SELECT version FROM schema_migrations ORDER BY version")]
+    assert versions == [version for version, _, _ in MIGRATIONS]
+    engine.dispose()
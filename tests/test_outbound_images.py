@@ -0,0 +1,42 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+from app.services.outbound_images import encode_for_provider
+
+
+def image_bytes(size, format, **params):
+    pixels = np.random.default_rng(0).integers(0, 255, (size[1], size[0], 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format=format, **params)
+    return buf.getvalue()
+
+
+def test_small_jpeg_is_sent_as_is():
+    original = image_bytes((320, 240), "JPEG", quality=40)
+
+    assert encode_for_provider(original, "openai_vision") == original
+
+
+def test_oversized_image_is_reencoded():
+    original = image_bytes((1600, 1200), "JPEG", quality=40)
+
+    prepared = encode_for_provider(original, "openai_vision")
+
+    assert Image.open(io.BytesIO(prepared)).size == (1024, 768)
+
+
+def test_png_is_converted_to_jpeg():
+    prepared = encode_for_provider(image_bytes((320, 240), "PNG"), "openai_vision")
+
+    assert Image.open(io.BytesIO(prepared)).format == "JPEG"
+
+
+def test_out_of_range_aspect_is_padded():
+    original = image_bytes((300, 1000), "JPEG", quality=40)
+
+    prepared = encode_for_provider(original, "runway")
+
+    assert Image.open(io.BytesIO(prepared)).size == (500, 1000)
+
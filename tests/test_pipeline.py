@@ -0,0 +1,59 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services import metrics
+from app.services.pipeline import Pipeline, PipelineError, PipelineRun, Stage
+
+
+async def fail(x):
+    raise RuntimeError("boom")
+
+
+async def echo(value):
+    return value
+
+
+def test_independent_stages_run_in_parallel():
+    spans = {}
+
+    def slow(name):
+        async def stage(x):
+            started = time.perf_counter()
+            await asyncio.sleep(0.05)
+            spans[name] = (started, time.perf_counter())
+            return x
+        return stage
+
+    pipeline = Pipeline("parallel", [
+        Stage("a", slow("a"), deps=("x",)),
+        Stage("b", slow("b"), deps=("x",)),
+        Stage("c", lambda a, b: echo(a + b), deps=("a", "b")),
+    ])
+    run = asyncio.run(pipeline.run({"x": 1}))
+    assert run.results["c"] == 2
+    # Каждая из параллельных стадий стартует до того, как закончится другая
+    assert spans["a"][0] < spans["b"][1] and spans["b"][0] < spans["a"][1]
+
+
+def test_failure_is_reported_and_counted_once():
+    # Зависимые стадии объявлены раньше упавшей
+    pipeline = Pipeline("failing", [
+        Stage("c", echo, deps=("b",)),
+        Stage("b", echo, deps=("a",)),
+        Stage("a", fail, deps=("x",)),
+    ])
+    run = PipelineRun()
+
+    async def scenario():
+        async for _ in pipeline.stream({"x": 1}, run):
+            pass
+
+    with pytest.raises(PipelineError) as error:
+        asyncio.run(scenario())
+
+    assert error.value.stage == "a"
+    assert "a" not in run.skipped and "b" in run.skipped
+    errors = [line for line in metrics.render().splitlines() if 'component="failing.' in line]
+    assert errors == ['youglow_errors_total{component="failing.a",error="RuntimeError"} 1']
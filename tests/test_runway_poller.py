@@ -0,0 +1,88 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import runway_poller
+from app.services.runway_poller import RunwayTaskError, RunwayTaskPoller
+
+
+# Ожидание в тестах ограничено, чтобы зависший опрос валил тест, а не весь прогон
+GUARD_TIMEOUT = 2
+
+
+def fake_client(retrieve):
+    return SimpleNamespace(tasks=SimpleNamespace(retrieve=retrieve))
+
+
+def test_client_failure_fails_pending_waits(monkeypatch):
+    def broken_client():
+        raise RuntimeError("no api key")
+
+    monkeypatch.setattr(runway_poller, "get_async_runway_client", broken_client)
+
+    async def scenario():
+        with pytest.raises(RunwayTaskError, match="polling stopped"):
+            await asyncio.wait_for(RunwayTaskPoller(interval=0.01).wait("t1", timeout=5), GUARD_TIMEOUT)
+
+    asyncio.run(scenario())
+
+
+def test_failing_progress_callback_does_not_stop_polling(monkeypatch):
+    statuses = iter(["RUNNING", "RUNNING", "SUCCEEDED"])
+
+    async def retrieve(task_id):
+        return SimpleNamespace(status=next(statuses), progress=0.5, output=["https://result"], failure=None)
+
+    monkeypatch.setattr(runway_poller, "get_async_runway_client", lambda: fake_client(retrieve))
+
+    def on_progress(status, progress):
+        raise ValueError("broken callback")
+
+    async def scenario():
+        poller = RunwayTaskPoller(interval=0.01)
+        result = await asyncio.wait_for(poller.wait("t1", on_progress=on_progress, timeout=5), GUARD_TIMEOUT)
+        assert result == ["https://result"]
+
+    asyncio.run(scenario())
+
+
+def test_wait_is_bounded_by_its_timeout(monkeypatch):
+    async def retrieve(task_id):
+        await asyncio.sleep(60)
+
+    monkeypatch.setattr(runway_poller, "get_async_runway_client", lambda: fake_client(retrieve))
+
+    async def scenario():
+        poller = RunwayTaskPoller(interval=0.01)
+        with pytest.raises(RunwayTaskError, match="timed out"):
+            await asyncio.wait_for(poller.wait("t1", timeout=0.1), GUARD_TIMEOUT)
+        assert poller.pending() == 0
+
+    asyncio.run(scenario())
+
+
+def test_failed_task_raises(monkeypatch):
+    async def retrieve(task_id):
+        return SimpleNamespace(status="FAILED", progress=None, output=None, failure="content moderation")
+
+    monkeypatch.setattr(runway_poller, "get_async_runway_client", lambda: fake_client(retrieve))
+
+    async def scenario():
+        with pytest.raises(RunwayTaskError, match="content moderation"):
+            await asyncio.wait_for(RunwayTaskPoller(interval=0.01).wait("t1", timeout=5), GUARD_TIMEOUT)
+
+    asyncio.run(scenario())
+
+
+def test_success_without_output_raises(monkeypatch):
+    async def retrieve(task_id):
+        return SimpleNamespace(status="SUCCEEDED", progress=1.0, output=[], failure=None)
+
+    monkeypatch.setattr(runway_poller, "get_async_runway_client", lambda: fake_client(retrieve))
+
+    async def scenario():
+        with pytest.raises(RunwayTaskError, match="succeeded without output"):
+            await asyncio.wait_for(RunwayTaskPoller(interval=0.01).wait("t1", timeout=5), GUARD_TIMEOUT)
+
+    asyncio.run(scenario())